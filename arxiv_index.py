@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from difflib import SequenceMatcher
+from typing import Optional
+
+ARXIV_INDEX_PATH = os.environ.get("ARXIV_INDEX_PATH", "arxiv_index.sqlite3")
+# Minimum similarity between the normalized reference and arXiv titles
+ARXIV_INDEX_MIN_SCORE = float(os.environ.get("ARXIV_INDEX_MIN_SCORE", 0.85))
+ARXIV_INDEX_CANDIDATES = 20
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_title(title: str) -> str:
+    # PDF extraction splits words ("supe rconductivity") and hyphenates
+    # ("room -temperature"), so compare titles with all separators removed
+    return "".join(_WORD.findall(title.lower()))
+
+
+def title_score(a: str, b: str) -> float:
+    return SequenceMatcher(None, normalize_title(a), normalize_title(b)).ratio()
+
+
+def fts_query(title: str) -> str:
+    words = [word for word in _WORD.findall(title.lower()) if len(word) > 2]
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class ArxivIndex:
+    def __init__(self, path: str = ARXIV_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                title TEXT NOT NULL,
+                abstract TEXT,
+                update_date TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                title, abstract, content='papers', content_rowid='rowid'
+            );
+            CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_fts(rowid, title, abstract)
+                VALUES (new.rowid, new.title, new.abstract);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+                INSERT INTO papers_fts(papers_fts, rowid, title, abstract)
+                VALUES ('delete', old.rowid, old.title, old.abstract);
+                INSERT INTO papers_fts(rowid, title, abstract)
+                VALUES (new.rowid, new.title, new.abstract);
+            END;
+            """
+        )
+        self._db.commit()
+
+    def ingest(self, jsonl_path: str, batch_size: int = 10_000) -> int:
+        # Records already present are only rewritten when the dump has a newer
+        # update_date, so re-running on a fresher dump is incremental
+        def rows():
+            with open(jsonl_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    yield (
+                        record["id"],
+                        " ".join(record["title"].split()),
+                        record.get("abstract", "").strip(),
+                        record.get("update_date", ""),
+                    )
+
+        changed = 0
+        batch = []
+        for row in rows():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                changed += self._upsert(batch)
+                batch = []
+        if batch:
+            changed += self._upsert(batch)
+        return changed
+
+    def _upsert(self, rows) -> int:
+        with self._lock:
+            cursor = self._db.executemany(
+                """INSERT INTO papers (id, title, abstract, update_date)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title,
+                    abstract = excluded.abstract,
+                    update_date = excluded.update_date
+                WHERE excluded.update_date > papers.update_date""",
+                rows,
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def lookup(self, title: str) -> Optional[dict]:
+        query = fts_query(title)
+        if not query:
+            return None
+        with self._lock:
+            candidates = self._db.execute(
+                """SELECT papers.id, papers.title FROM papers_fts
+                JOIN papers ON papers.rowid = papers_fts.rowid
+                WHERE papers_fts MATCH ? ORDER BY rank LIMIT ?""",
+                (f"title : ({query})", ARXIV_INDEX_CANDIDATES),
+            ).fetchall()
+        best = None
+        for arxiv_id, candidate_title in candidates:
+            score = title_score(title, candidate_title)
+            if best is None or score > best["score"]:
+                best = {"id": arxiv_id, "title": candidate_title, "score": score}
+        if best is None or best["score"] < ARXIV_INDEX_MIN_SCORE:
+            return None
+        best["url"] = f"http://arxiv.org/pdf/{best['id']}"
+        return best
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM papers").fetchone()
+        return count
+
+
+_arxiv_index = None
+
+
+def get_arxiv_index() -> Optional[ArxivIndex]:
+    # The index is optional: without a built index file every lookup misses
+    global _arxiv_index
+    if _arxiv_index is None and os.path.exists(ARXIV_INDEX_PATH):
+        _arxiv_index = ArxivIndex(ARXIV_INDEX_PATH)
+    return _arxiv_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local arXiv metadata index for offline reference lookup"
+    )
+    parser.add_argument("--index", default=ARXIV_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser(
+        "ingest", help="add or update records from an arXiv metadata JSON lines dump"
+    )
+    ingest.add_argument("dump")
+    lookup = subparsers.add_parser("lookup", help="look up a reference title")
+    lookup.add_argument("title")
+    args = parser.parse_args()
+
+    index = ArxivIndex(args.index)
+    if args.command == "ingest":
+        changed = index.ingest(args.dump)
+        print(f"{changed} records added or updated, {len(index)} indexed")
+    else:
+        print(json.dumps(index.lookup(args.title), indent=2))
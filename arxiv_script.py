@@ -1,9 +1,120 @@
-from functools import lru_cache
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import arxiv
+import feedparser
+import requests
+from requests.adapters import HTTPAdapter
 
+from arxiv_index import get_arxiv_index
+from cassette import CassetteAdapter, get_cassette
+from shared_state import shared_cache
+from tracing import propagate, traced
 
-@lru_cache(maxsize=1000)
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+# Process-wide request budget shared by every thread talking to arXiv; the
+# API terms ask for no more than one request every three seconds
+ARXIV_REQUESTS_PER_SECOND = float(os.environ.get("ARXIV_REQUESTS_PER_SECOND", 1 / 3))
+ARXIV_BURST = int(os.environ.get("ARXIV_BURST", 1))
+# Reference lookups in flight at once for one paper
+ARXIV_MAX_CONCURRENCY = int(os.environ.get("ARXIV_MAX_CONCURRENCY", 4))
+ARXIV_TIMEOUT = float(os.environ.get("ARXIV_TIMEOUT", 30))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedArxivClient(arxiv.Client):
+    # One keep-alive session and one rate limiter for the whole process, in
+    # place of the per-search default clients and their independent delays.
+    # arxiv has no public hook for the session, so this overrides the private
+    # _parse_feed of the arxiv version pinned in requirements.txt;
+    # tests/test_arxiv_script.py checks it still does the fetching
+    def __init__(
+        self,
+        api_url: str = ARXIV_API_URL,
+        rate: float = ARXIV_REQUESTS_PER_SECOND,
+        burst: int = ARXIV_BURST,
+        pool_size: int = ARXIV_MAX_CONCURRENCY,
+        num_retries: int = 3,
+    ):
+        super().__init__(page_size=100, delay_seconds=0, num_retries=num_retries)
+        self.query_url_format = api_url + "?{}"
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 2))
+        if get_cassette() is not None:
+            adapter = CassetteAdapter(
+                get_cassette(), pool_connections=1, pool_maxsize=max(pool_size, 2)
+            )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _parse_feed(self, url: str, first_page: bool = True):
+        err = None
+        # Replayed responses never reach arXiv, so they are not rate limited
+        cassette = get_cassette()
+        limited = cassette is None or not cassette.replaying
+        for retry in range(self.num_retries + 1):
+            if limited:
+                self.bucket.acquire()
+            try:
+                response = self.session.get(url, timeout=ARXIV_TIMEOUT)
+            except requests.RequestException as e:
+                err = e
+                continue
+            feed = feedparser.parse(response.content)
+            feed["status"] = response.status_code
+            if response.status_code != 200:
+                err = arxiv.HTTPError(url, retry, feed)
+            elif len(feed.entries) == 0 and not first_page:
+                err = arxiv.UnexpectedEmptyPageError(url, retry)
+            else:
+                return feed
+        raise err
+
+
+arxiv_client = SharedArxivClient()
+# Runs the relevance and date searches of one query side by side
+_search_executor = ThreadPoolExecutor(max_workers=ARXIV_MAX_CONCURRENCY)
+
+
+def _run_search(search: arxiv.Search) -> List[dict]:
+    return [
+        {
+            "title": result.title,
+            "summary": result.summary,
+            "url": result.pdf_url,
+            "publishedDate": str(result.published),
+        }
+        for result in arxiv_client.results(search)
+    ]
+
+
+@traced("search_arxiv", cache=shared_cache("search_arxiv", maxsize=1000))
 def search_arxiv(query, numRecentPapers=5, numMostCitedPapers=5):
     searchRelevance = arxiv.Search(
         query=query,
@@ -18,25 +129,70 @@ def search_arxiv(query, numRecentPapers=5, numMostCitedPapers=5):
         sort_order=arxiv.SortOrder.Descending,
     )
 
-    papers = []
+    relevance = _search_executor.submit(_run_search, searchRelevance)
+    by_date = _search_executor.submit(_run_search, searchDate)
 
-    for result in searchRelevance.results():
-        papers.append(
-            {
-                "title": result.title,
-                "summary": result.summary,
-                "url": result.pdf_url,
-                "publishedDate": str(result.published),
-            }
-        )
-    for result in searchDate.results():
-        papers.append(
-            {
-                "title": result.title,
-                "summary": result.summary,
-                "url": result.pdf_url,
-                "publishedDate": str(result.published),
-            }
-        )
-    # papers =
+    # Relevance hits first, then recent papers not already listed
+    papers = []
+    seen_urls = set()
+    for paper in relevance.result() + by_date.result():
+        if paper["url"] not in seen_urls:
+            seen_urls.add(paper["url"])
+            papers.append(paper)
     return papers
+
+
+@traced("resolve_reference", cache=shared_cache("resolve_reference", maxsize=1000))
+def resolve_reference(title: str) -> Optional[str]:
+    index = get_arxiv_index()
+    if index is not None:
+        match = index.lookup(title)
+        if match is not None:
+            return match["url"]
+
+    # Only the top relevance hit is used, so fetch exactly one result
+    search = arxiv.Search(
+        query=title,
+        max_results=1,
+        sort_by=arxiv.SortCriterion.Relevance,
+        sort_order=arxiv.SortOrder.Descending,
+    )
+    for result in arxiv_client.results(search):
+        return result.pdf_url
+    return None
+
+
+class ReferenceResolver:
+    # Starts resolving titles as soon as they are known, so lookups overlap
+    # with whatever is still producing the rest of the titles
+    def __init__(self, max_workers: int = ARXIV_MAX_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, title: str):
+        with self.lock:
+            if title not in self.futures:
+                self.futures[title] = self.executor.submit(
+                    propagate(resolve_reference), title
+                )
+
+    def results(self, titles: List[str]) -> Dict[str, Optional[str]]:
+        unique_titles = list(dict.fromkeys(titles))
+        for title in unique_titles:
+            self.submit(title)
+        return {title: self.futures[title].result() for title in unique_titles}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Lookups nobody waited for are dropped
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def resolve_references(titles: List[str]) -> Dict[str, Optional[str]]:
+    if not titles:
+        return {}
+    with ReferenceResolver(min(ARXIV_MAX_CONCURRENCY, len(set(titles)))) as resolver:
+        return resolver.results(titles)
@@ -0,0 +1,24 @@
+import functools
+from collections import OrderedDict
+
+
+def async_lru_cache(maxsize: int = 128):
+    # functools.lru_cache would cache the coroutine object, not its result
+    def decorator(fn):
+        cache = OrderedDict()
+
+        @functools.wraps(fn)
+        async def wrapper(*args):
+            if args in cache:
+                cache.move_to_end(args)
+                return cache[args]
+            result = await fn(*args)
+            cache[args] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,61 @@
+"""Sequential default-client arXiv searches vs the shared rate-limited client.
+
+Runs both against a local fake Atom feed server with artificial latency:
+
+    python -m benchmarks.arxiv_client [latency_seconds] [queries]
+"""
+import sys
+import time
+
+import arxiv
+
+import arxiv_script
+from benchmarks.fake_services import FakeServer
+
+
+def baseline_search(query: str) -> list:
+    # The pre-shared-client implementation: two searches back to back, each
+    # with a fresh default client
+    papers = []
+    for sort_by in (arxiv.SortCriterion.Relevance, arxiv.SortCriterion.SubmittedDate):
+        search = arxiv.Search(query=query, max_results=5, sort_by=sort_by)
+        papers.extend(result.pdf_url for result in search.results())
+    return papers
+
+
+def timed(fn, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    queries = [f"language models {i}" for i in range(num_queries)]
+
+    with FakeServer(latency=latency) as server:
+        api_url = server.url + "/api/query"
+        arxiv.Client.query_url_format = api_url + "?{}"
+        # Rate limit well above the fake server's capacity so only latency counts
+        arxiv_script.arxiv_client = arxiv_script.SharedArxivClient(
+            api_url=api_url, rate=1000, burst=1000
+        )
+
+        requests_before = server.requests
+        baseline = timed(baseline_search, queries)
+        baseline_requests = server.requests - requests_before
+
+        connections_before = server.connections
+        requests_before = server.requests
+        shared = timed(arxiv_script.search_arxiv.__wrapped__, queries)
+        shared_requests = server.requests - requests_before
+        shared_connections = server.connections - connections_before
+
+    print(f"{num_queries} queries, {latency * 1000:.0f} ms server latency")
+    print(f"default clients, sequential: {baseline:.2f}s ({baseline_requests} requests)")
+    print(
+        f"shared client, concurrent:   {shared:.2f}s ({shared_requests} requests, "
+        f"{shared_connections} connections)  speedup x{baseline / shared:.2f}"
+    )
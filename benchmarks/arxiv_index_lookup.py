@@ -0,0 +1,91 @@
+"""Title -> URL lookup latency of the local arXiv metadata index.
+
+Builds a throwaway index from a synthetic metadata dump that contains the
+references listed in parsed.txt (with their PDF extraction artifacts cleaned
+up, as arXiv would store them) plus random filler records, then looks up the
+raw reference titles as they appear in the extracted text:
+
+    python -m benchmarks.arxiv_index_lookup [filler_records]
+"""
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from arxiv_index import ArxivIndex
+
+AUTHORS = re.compile(r"^(?:(?:[A-Z]\.\s?-?)+\s?[\w' -]+?(?:\s+et al\.)?,\s*)+")
+
+
+def reference_titles(text: str) -> list:
+    section = text.split("References  and Notes", 1)[1]
+    entries = re.split(r"\s(?=\d{1,2}\. [A-Z]\.)", section)
+    titles = []
+    for entry in entries:
+        entry = " ".join(entry.split())
+        entry = re.sub(r"^\d{1,2}\. ", "", entry)
+        entry = AUTHORS.sub("", entry)
+        title = entry.split(". ")[0].strip()
+        if len(title) > 15:
+            titles.append(title)
+    return titles
+
+
+def clean(title: str) -> str:
+    return re.sub(r"\s+-", "-", title)
+
+
+def write_dump(path: str, titles: list, filler: int):
+    rng = random.Random(0)
+    # A large synthetic vocabulary that shares some words with the references,
+    # so filler records still compete for the common terms
+    vocabulary = re.findall(r"[a-z]{4,}", " ".join(titles).lower()) + [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10)))
+        for _ in range(20_000)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for i, title in enumerate(titles):
+            record = {"id": f"2301.{i:05d}", "title": clean(title), "abstract": "", "update_date": "2023-01-01"}
+            f.write(json.dumps(record) + "\n")
+        for i in range(filler):
+            words = rng.sample(vocabulary, 8)
+            record = {"id": f"1901.{i:05d}", "title": " ".join(words).capitalize(), "abstract": " ".join(rng.sample(vocabulary, 30)), "update_date": "2019-01-01"}
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    filler = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with open("parsed.txt", encoding="utf-8") as f:
+        titles = reference_titles(f.read())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "dump.jsonl")
+        write_dump(dump, titles, filler)
+        index = ArxivIndex(os.path.join(tmp, "index.sqlite3"))
+
+        start = time.perf_counter()
+        index.ingest(dump)
+        ingest = time.perf_counter() - start
+        start = time.perf_counter()
+        changed = index.ingest(dump)
+        reingest = time.perf_counter() - start
+
+        timings = []
+        hits = 0
+        for title in titles:
+            start = time.perf_counter()
+            match = index.lookup(title)
+            timings.append((time.perf_counter() - start) * 1000)
+            hits += match is not None and match["title"] == clean(title)
+
+    timings.sort()
+    print(f"{len(titles) + filler} records: ingest {ingest:.2f}s, re-ingest {reingest:.2f}s ({changed} changed)")
+    print(f"{len(titles)} reference titles from parsed.txt, {hits} resolved correctly")
+    print(
+        f"lookup p50 {statistics.median(timings):.2f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms, max {timings[-1]:.2f} ms"
+    )
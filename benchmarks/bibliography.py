@@ -0,0 +1,62 @@
+"""Local bibliography parsing vs having Claude re-type the reference list.
+
+Parses the reference list of parsed.txt, superconductor.pdf and a sample of
+"First M. Last" author lists, and estimates the completion tokens saved by
+sending the compact "[bibkey] title" list instead of asking for <bibitem> XML:
+
+    python -m benchmarks.bibliography [path/to/paper.pdf]
+"""
+import sys
+import time
+
+from bibliography import format_bibliography, parse_bibliography
+from claude import count_tokens
+from pdf_parser import pdf_to_text
+
+# NeurIPS-style entries: given names first, middle initials, single authors
+AUTHOR_LISTS = """References
+
+[1] Jimmy Lei Ba, Jamie Ryan Kiros, and Geoffrey E. Hinton. Layer normalization. arXiv preprint arXiv:1607.06450, 2016.
+[2] Dzmitry Bahdanau, Kyunghyun Cho, and Yoshua Bengio. Neural machine translation by jointly learning to align and translate. CoRR, abs/1409.0473, 2014.
+[3] Denny Britz, Anna Goldie, Minh-Thang Luong, and Quoc V. Le. Massive exploration of neural machine translation architectures. CoRR, abs/1703.03906, 2017.
+[4] Quoc V. Le. Building high-level features using large scale unsupervised learning. In ICASSP, 2013.
+[5] Sepp Hochreiter and Jürgen Schmidhuber. Long short-term memory. Neural computation, 9(8):1735-1780, 1997.
+[6] Yoon Kim, Carl Denton, Luong Hoang, and Alexander M. Rush. Structured attention networks. In ICLR, 2017.
+"""
+
+
+def bibitem_xml(bibliography: list) -> str:
+    # What the original prompt has the model write out for the same references
+    items = "".join(
+        f"""
+        <bibitem>
+            <bibkey>{ref['bibkey']}</bibkey>
+            <title>{ref['title']}</title>
+            <reference_text>{ref['reference_text']}</reference_text>
+        </bibitem>"""
+        for ref in bibliography
+    )
+    return f"<references>{items}\n</references>"
+
+
+def report(name: str, paper_text: str):
+    start = time.perf_counter()
+    bibliography = parse_bibliography(paper_text)
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {len(bibliography)} entries parsed in {elapsed * 1000:.1f} ms")
+    for ref in bibliography[:6]:
+        print(f"  [{ref['bibkey']}] {ref['title']}")
+    if not bibliography:
+        return
+    xml_tokens = count_tokens(bibitem_xml(bibliography))
+    list_tokens = count_tokens(format_bibliography(bibliography))
+    print(f"  completion tokens no longer generated: ~{xml_tokens}")
+    print(f"  prompt tokens for the compact list:    ~{list_tokens}")
+
+
+if __name__ == "__main__":
+    path_to_pdf = sys.argv[1] if len(sys.argv) > 1 else "superconductor.pdf"
+    with open("parsed.txt", encoding="utf-8") as f:
+        report("parsed.txt", f.read())
+    report("author lists", AUTHOR_LISTS)
+    report(path_to_pdf, pdf_to_text(path_to_pdf))
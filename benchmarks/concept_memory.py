@@ -0,0 +1,73 @@
+"""Bytes per graph concept: the old dict of pydantic ConceptNodes vs ConceptStore.
+
+Builds graphs shaped like /query output (nine ideas per paper, novel ideas
+sharing the paper URL, previous-work ideas citing one of a pool of papers)
+from freshly created strings, as they arrive from parsing or Firestore, and
+measures what each container holds on to with tracemalloc:
+
+    python -m benchmarks.concept_memory [papers] [cited_papers]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+import uuid
+
+
+def concept_fields(papers: int, cited_papers: int):
+    description = "A description of the idea and how the paper builds on it. " * 5
+    for paper in range(papers):
+        pdf_url = f"http://arxiv.org/pdf/{2300 + paper % 100}.{paper:05d}v1"
+        parent = str(uuid.UUID(int=paper))
+        for idea in range(9):
+            novel = idea >= 6
+            cited = (paper * 7 + idea) % cited_papers
+            yield {
+                "name": f"Idea {idea} of paper {paper}",
+                "id": str(uuid.uuid4()),
+                "referenceUrl": pdf_url if novel else f"http://arxiv.org/pdf/2101.{cited:05d}v2",
+                "description": f"{description}{idea}",
+                "referenceText": "" if novel else f"Author {cited}, et al. Title of the cited paper {cited}. 2021.",
+                "parent": f"{parent}",
+            }
+
+
+def measure(name: str, build, nodes: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    container = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_node = current / nodes
+    print(f"{name:<34} {current / 1024**2:8.2f} MiB  {per_node:8.0f} bytes/node")
+    del container
+    return per_node
+
+
+if __name__ == "__main__":
+    papers = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cited_papers = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    nodes = papers * 9
+
+    os.environ["FIRESTORE_IN_MEMORY"] = "1"
+    os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+    from concept_store import ConceptStore
+    from server import ConceptNode
+
+    def concept_map():
+        concepts = {}
+        for fields in concept_fields(papers, cited_papers):
+            concepts[fields["id"]] = ConceptNode(**fields)
+        return concepts
+
+    def concept_store():
+        store = ConceptStore(max_entries=nodes)
+        for fields in concept_fields(papers, cited_papers):
+            store.put(ConceptNode(**fields))
+        return store
+
+    print(f"{nodes} concepts from {papers} papers citing {cited_papers} papers")
+    before = measure("dict of ConceptNode", concept_map, nodes)
+    after = measure("ConceptStore", concept_store, nodes)
+    print(f"x{before / after:.2f} fewer bytes per concept")
@@ -0,0 +1,159 @@
+"""Local stand-ins for the network services the pipeline talks to."""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+
+def atom_entry(port: int, arxiv_id: str, title: str) -> str:
+    return f"""<entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <updated>2023-07-27T17:59:59Z</updated>
+    <published>2023-07-27T17:59:59Z</published>
+    <title>{escape(title)}</title>
+    <summary>Summary of {escape(title)}</summary>
+    <author><name>A. Author</name></author>
+    <link href="http://127.0.0.1:{port}/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://127.0.0.1:{port}/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.CL" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cs.CL" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>"""
+
+
+def atom_feed(port: int, query: str, sort_by: str, start: int, max_results: int) -> str:
+    # Deterministic ids per (query, sort) so relevance and date results overlap
+    # on the first couple of entries, like the real API often does
+    entries = []
+    for i in range(start, start + max_results):
+        salt = "" if i < 2 else sort_by
+        digest = hashlib.sha1(f"{query}|{salt}|{i}".encode()).hexdigest()
+        arxiv_id = f"{int(digest[:4], 16) % 9000 + 1000}.{int(digest[4:9], 16) % 90000 + 10000}"
+        entries.append(atom_entry(port, arxiv_id, f"{query} result {i}"))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title>arXiv Query: {escape(query)}</title>
+  <opensearch:totalResults>1000</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>
+  {"".join(entries)}
+</feed>"""
+
+
+class FakeServer:
+    """Threaded HTTP server on 127.0.0.1 with an artificial per-request latency.
+
+    Serves an arXiv-style Atom API at /api/query, PDFs registered in
+    ``pdfs`` (path -> bytes) with ETag support, and an Anthropic-style
+    /v1/complete endpoint that answers every prompt with ``completion``,
+    streamed word by word over SSE with ``token_delay`` between deltas and
+    ending with ``stop_reason``.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        pdfs: dict = None,
+        completion: str = "",
+        token_delay: float = 0.0,
+        stop_reason: str = "stop_sequence",
+    ):
+        self.latency = latency
+        self.pdfs = pdfs or {}
+        self.completion = completion
+        self.token_delay = token_delay
+        self.stop_reason = stop_reason
+        self.requests = 0
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                if parts.path == "/api/query":
+                    args = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                    body = atom_feed(
+                        server.port,
+                        args.get("search_query", ""),
+                        args.get("sortBy", "relevance"),
+                        int(args.get("start", 0)),
+                        int(args.get("max_results", 10)),
+                    ).encode()
+                    self._send(200, body, "application/atom+xml")
+                elif parts.path in server.pdfs:
+                    body = server.pdfs[parts.path]
+                    etag = '"%s"' % hashlib.md5(body).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        self._send(304, b"", headers={"ETag": etag})
+                    else:
+                        self._send(200, body, "application/pdf", {"ETag": etag})
+                else:
+                    self._send(404, b"")
+
+            def do_POST(self):
+                server.requests += 1
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(server.latency)
+                if urlsplit(self.path).path != "/v1/complete":
+                    self._send(404, b"")
+                    return
+                if not request.get("stream"):
+                    time.sleep(server.token_delay * len(re.findall(r"\s*\S+", server.completion)))
+                    body = json.dumps(self._completion(server.completion, server.stop_reason))
+                    self._send(200, body.encode(), "application/json")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                deltas = re.findall(r"\s*\S+", server.completion) + [""]
+                for i, delta in enumerate(deltas):
+                    stop_reason = server.stop_reason if i == len(deltas) - 1 else None
+                    event = json.dumps(self._completion(delta, stop_reason))
+                    self._write_chunk(f"event: completion\ndata: {event}\n\n".encode())
+                    time.sleep(server.token_delay)
+                self._write_chunk(b"")
+
+            def _completion(self, text, stop_reason):
+                return {"completion": text, "stop_reason": stop_reason, "model": "claude-2"}
+
+            def _write_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _send(self, status, body, content_type="text/plain", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
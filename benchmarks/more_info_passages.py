@@ -0,0 +1,50 @@
+"""Prompt size of /more-info with the whole paper vs the top-k BM25 passages.
+
+Builds the passage index for a paper, selects the passages for a few concept
+descriptions and compares the expand prompt's token count either way:
+
+    python -m benchmarks.more_info_passages [path/to/paper.pdf | parsed.txt] [k]
+"""
+import sys
+import time
+
+from claude import count_tokens
+from functions.expand_description_to_text import _expand_prompt
+from passage_index import PassageIndex, relevant_passages
+
+DESCRIPTIONS = (
+    "LK-99 is a copper-doped lead apatite that the authors report as a room-temperature superconductor at ambient pressure.",
+    "The Meissner effect, levitation of the sample over a magnet, is used as evidence of superconductivity.",
+    "The superconductivity is attributed to a volume contraction from Cu2+ substituting Pb2+ ions, which creates superconducting quantum wells.",
+)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "parsed.txt"
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    if path.endswith(".pdf"):
+        from pdf_parser import pdf_to_text
+
+        paper_text = pdf_to_text(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            paper_text = f.read()
+
+    start = time.perf_counter()
+    index = PassageIndex(paper_text)
+    built = time.perf_counter() - start
+    print(
+        f"{path}: {len(paper_text.split())} words, {len(index.spans)} passages, "
+        f"{len(index.vocabulary)} terms, index built in {built * 1000:.1f} ms"
+    )
+
+    for description in DESCRIPTIONS:
+        start = time.perf_counter()
+        for _ in range(100):
+            index.top_passages(description, k)
+        selected = (time.perf_counter() - start) / 100
+        whole = count_tokens(_expand_prompt(description, paper_text))
+        passages = count_tokens(_expand_prompt(description, relevant_passages(paper_text, description, k)))
+        print(f"\n{description[:72]}...")
+        print(f"  top {k} passages in {selected * 1e6:.0f} us")
+        print(f"  prompt tokens: {whole} whole paper, {passages} passages (x{whole / passages:.1f} fewer)")
@@ -0,0 +1,75 @@
+"""Peak memory of concurrent PDF downloads and of opening a PDF for parsing.
+
+A local fake server serves superconductor.pdf padded to a large size. The
+buffered baseline reads each response body into memory before writing it
+out, as download_pdf used to; the PDF cache streams it to disk in chunks.
+Opening superconductor.pdf compares PdfReader on a path (which copies the
+file into memory) with the memory-mapped open_pdf:
+
+    python -m benchmarks.pdf_download [megabytes] [concurrent_downloads]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PyPDF2 import PdfReader
+
+from benchmarks.fake_services import FakeServer
+
+
+def buffered_download(session: requests.Session, url: str, directory: str) -> str:
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".pdf")
+    with os.fdopen(fd, "wb") as file:
+        file.write(session.get(url).content)
+    return path
+
+
+def peak(name: str, run, per: int = 1):
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<40} {elapsed:6.2f}s  peak {peak_bytes / 1024**2:8.2f} MiB  ({peak_bytes / per / 1024**2:.2f} MiB each)")
+
+
+if __name__ == "__main__":
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    downloads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with open("superconductor.pdf", "rb") as f:
+        pdf = f.read()
+    large_pdf = pdf + b"\n%" + b"0" * (megabytes * 1024**2 - len(pdf)) + b"\n"
+    pdfs = {f"/pdf/{i}": large_pdf for i in range(downloads)}
+
+    with FakeServer(pdfs=pdfs) as server, tempfile.TemporaryDirectory() as directory:
+        os.environ.pop("CASSETTE_PATH", None)
+        import pdf_cache
+        from pdf_parser import open_pdf
+
+        urls = [server.url + path for path in pdfs]
+        print(f"{downloads} concurrent downloads of {len(large_pdf) / 1024**2:.0f} MiB")
+        session = requests.Session()
+        with ThreadPoolExecutor(max_workers=downloads) as executor:
+            peak(
+                "buffered (response.content)",
+                lambda: list(executor.map(lambda url: buffered_download(session, url, directory), urls)),
+                downloads,
+            )
+            cache = pdf_cache.PdfCache(os.path.join(directory, "cache"))
+            peak("streamed (PdfCache)", lambda: list(executor.map(cache.get, urls)), downloads)
+
+        def pages_from_path():
+            return len(PdfReader("superconductor.pdf").pages)
+
+        def pages_from_map():
+            with open_pdf("superconductor.pdf") as reader:
+                return len(reader.pages)
+
+        peak("open PdfReader(path)", pages_from_path)
+        peak("open open_pdf(path)", pages_from_map)
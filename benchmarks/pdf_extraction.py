@@ -0,0 +1,44 @@
+"""Single-core vs N-core PDF text extraction throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.pdf_extraction [path/to/paper.pdf] [max_workers]
+"""
+import os
+import sys
+import time
+
+from pdf_parser import pdf_to_text
+
+
+def bench(path_to_pdf: str, workers: int, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        pdf_to_text.cache_clear()
+        start = time.perf_counter()
+        pdf_to_text(path_to_pdf, workers)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    from PyPDF2 import PdfReader
+
+    path_to_pdf = sys.argv[1] if len(sys.argv) > 1 else "superconductor.pdf"
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    num_pages = len(PdfReader(path_to_pdf).pages)
+
+    # Warm the pool so worker start-up is not charged to the first run
+    pdf_to_text(path_to_pdf, max_workers)
+
+    baseline = bench(path_to_pdf, 1)
+    print(f"{path_to_pdf}: {num_pages} pages, {os.cpu_count()} CPUs")
+    print(f"workers=1  {baseline:.2f}s  {num_pages / baseline:.1f} pages/s")
+    workers = 2
+    while workers <= max_workers:
+        elapsed = bench(path_to_pdf, workers)
+        print(
+            f"workers={workers:<2} {elapsed:.2f}s  {num_pages / elapsed:.1f} pages/s"
+            f"  speedup x{baseline / elapsed:.2f}"
+        )
+        workers *= 2
@@ -0,0 +1,67 @@
+"""Cold /query runs replayed from a cassette, for offline profiling.
+
+Record the Claude, arXiv and PDF traffic of a query once with network access,
+then replay it anywhere with recorded or synthetic latency:
+
+    CASSETTE_PATH=query.jsonl.gz CASSETTE_MODE=record python -m benchmarks.query_replay "attention" 1
+    CASSETTE_PATH=query.jsonl.gz CASSETTE_LATENCY=none python -m benchmarks.query_replay "attention" 5
+
+Every run starts with empty in-process caches, a fresh PDF cache and a fresh
+insight store, so each one repeats the whole pipeline.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("FIRESTORE_IN_MEMORY", "1")
+# Background prefetches would add cache hits and requests the replay never made
+os.environ.setdefault("PREFETCH_WORKERS", "0")
+
+import arxiv_script
+import insight_store
+import pdf_cache
+import pdf_parser
+import server
+from cassette import get_cassette
+from functions import insight_extraction, top_one
+
+
+def reset_caches(directory: str):
+    for fn in (
+        pdf_parser.pdf_url_to_text,
+        pdf_parser.pdf_to_text,
+        arxiv_script.search_arxiv,
+        arxiv_script.resolve_reference,
+        top_one.top_one_,
+        insight_extraction.extract_key_insights,
+    ):
+        fn.cache_clear()
+    server.concept_store.clear()
+    pdf_cache._pdf_cache = pdf_cache.PdfCache(os.path.join(directory, "pdf_cache"))
+    insight_store._insight_store = insight_store.InsightStore(
+        os.path.join(directory, "insights.sqlite3")
+    )
+
+
+if __name__ == "__main__":
+    if get_cassette() is None:
+        sys.exit("Set CASSETTE_PATH (and CASSETTE_MODE=record for the first run)")
+    query = sys.argv[1] if len(sys.argv) > 1 else "attention"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as directory:
+            reset_caches(directory)
+            start = time.perf_counter()
+            graph = server.send_query(server.Query(query=query))
+            timings.append(time.perf_counter() - start)
+
+    print(f"{runs} cold /query runs for {query!r}: {len(server.concept_store)} concepts")
+    print(
+        f"median {statistics.median(timings):.2f}s, "
+        f"min {min(timings):.2f}s, max {max(timings):.2f}s"
+    )
+    print(f"cassette: {get_cassette().stats()}")
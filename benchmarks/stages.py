@@ -0,0 +1,308 @@
+"""Per-stage benchmarks of the paper-to-graph pipeline on the bundled fixtures.
+
+Every stage runs in isolation against local stand-ins (a fake arXiv/PDF
+server and the in-memory Firestore). Reports latency percentiles, throughput
+and peak traced memory, and writes them as JSON so runs can be compared:
+
+    python -m benchmarks.stages [--iterations N] [--output stages.json] [--compare previous.json] [stage ...]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_services import FakeServer
+
+STAGES = (
+    "download_pdf",
+    "pdf_to_text",
+    "parse_insights",
+    "resolve_references",
+    "hydrate_node",
+    "firestore_writes",
+)
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(name: str, run, iterations: int, items: int = 1, setup=None) -> dict:
+    # run() is timed without tracing; one extra traced call gives peak memory
+    timings = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "stage": name,
+        "iterations": iterations,
+        "items": items,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p90_ms": percentile(timings, 0.9) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "items_per_s": items / statistics.median(timings),
+        "peak_memory_bytes": peak,
+    }
+    print(
+        f"{name:<32} p50 {result['p50_ms']:9.2f} ms  p90 {result['p90_ms']:9.2f} ms  "
+        f"p99 {result['p99_ms']:9.2f} ms  {result['items_per_s']:12.1f} items/s  "
+        f"peak {peak / 1024**2:8.2f} MiB"
+    )
+    return result
+
+
+def sample_payloads(path: str = "sample_requests.http") -> list:
+    # JSON bodies of the uncommented requests
+    with open(path, encoding="utf-8") as f:
+        requests = f.read().split("###")
+    payloads = []
+    for request in requests:
+        lines = [line for line in request.splitlines() if not line.lstrip().startswith("#")]
+        text = "\n".join(lines)
+        if "{" in text:
+            try:
+                payloads.append(json.loads(text[text.index("{") :]))
+            except json.JSONDecodeError:
+                pass
+    return payloads
+
+
+def synthetic_completion(bibliography: list) -> str:
+    # Shaped like a real extract_key_insights completion for parsed.txt
+    references = "".join(
+        f"""
+    <bibitem>
+        <bibkey>{ref['bibkey']}</bibkey>
+        <title>{ref['title']}</title>
+        <reference_text>{ref['reference_text']}</reference_text>
+    </bibitem>"""
+        for ref in bibliography
+    )
+    description = "A description of the idea and how the paper uses it. " * 6
+    ideas = "".join(
+        f"""
+<previous_work_idea>
+    <idea_name>Idea {i}</idea_name>
+    <description>{description}</description>
+    <relevant_references><bibkey>{ref['bibkey']}</bibkey></relevant_references>
+</previous_work_idea>"""
+        for i, ref in enumerate(bibliography[:6])
+    )
+    novel = "".join(
+        f"""
+<novel_idea>
+    <idea_name>Novel {i}</idea_name>
+    <description>{description}</description>
+</novel_idea>"""
+        for i in range(3)
+    )
+    return f"<references>{references}\n</references>{ideas}{novel}"
+
+
+def synthetic_graph(server, fanout: int, depth: int):
+    # concept_store entries plus the nested id_map hydrate_node walks
+    server.concept_store.clear()
+    counter = 0
+
+    def build(parent_id: str, level: int) -> dict:
+        nonlocal counter
+        children = {}
+        for _ in range(fanout):
+            counter += 1
+            node_id = str(counter)
+            server.concept_store.put(
+                server.ConceptNode(
+                    name=f"Concept {node_id}",
+                    referenceUrl=f"http://arxiv.org/pdf/{node_id}",
+                    description="A description of the concept. " * 4,
+                    id=node_id,
+                    parent=parent_id,
+                )
+            )
+            children[node_id] = build(node_id, level + 1) if level < depth else {}
+        return children
+
+    return {"-1": build("-1", 1)}, counter + 1
+
+
+def bench_download_pdf(iterations, server_url, directory):
+    import pdf_cache
+    import pdf_parser
+
+    url = server_url + "/pdf/superconductor"
+
+    def cold_cache():
+        pdf_cache._pdf_cache = pdf_cache.PdfCache(tempfile.mkdtemp(dir=directory))
+
+    yield measure("download_pdf (cold)", lambda: pdf_parser.download_pdf(url), iterations, setup=cold_cache)
+    pdf_parser.download_pdf(url)
+    yield measure("download_pdf (cached)", lambda: pdf_parser.download_pdf(url), iterations)
+
+
+def bench_pdf_to_text(iterations, path="superconductor.pdf"):
+    import pdf_parser
+    from PyPDF2 import PdfReader
+
+    pages = len(PdfReader(path).pages)
+    for workers in sorted({1, pdf_parser.PDF_EXTRACT_WORKERS}):
+        yield measure(
+            f"pdf_to_text ({workers} workers)",
+            lambda: pdf_parser.pdf_to_text(path, workers),
+            iterations,
+            items=pages,
+            setup=pdf_parser.pdf_to_text.cache_clear,
+        )
+
+
+def bench_parse_insights(iterations, paper_text):
+    from bibliography import parse_bibliography
+    from functions.insight_extraction import parse_insights
+
+    bibliography = parse_bibliography(paper_text)
+    completion = synthetic_completion(bibliography)
+    yield measure("parse_bibliography", lambda: parse_bibliography(paper_text), iterations, items=len(bibliography))
+    elements = len(bibliography) + len(parse_insights(completion)["ideas"])
+    yield measure("parse_insights", lambda: parse_insights(completion), iterations, items=elements)
+
+
+def bench_resolve_references(iterations, titles):
+    import arxiv_script
+
+    yield measure(
+        "resolve_references",
+        lambda: arxiv_script.resolve_references(titles),
+        iterations,
+        items=len(titles),
+        setup=arxiv_script.resolve_reference.cache_clear,
+    )
+
+
+def bench_hydrate_node(iterations, query):
+    import server
+    from concept_store import ConceptStore
+
+    # Room for the largest synthetic graph, so nothing is reloaded from Firestore
+    server.concept_store = ConceptStore(max_entries=200_000)
+    for fanout, depth in ((6, 4), (10, 5)):
+        id_map, nodes = synthetic_graph(server, fanout, depth)
+        schema = server.idGraphSchema(id="-1", query=query, id_map=id_map)
+        yield measure(
+            f"hydrate_node ({nodes} nodes)",
+            lambda: server.hydrate_node(schema),
+            iterations,
+            items=nodes,
+        )
+    server.concept_store.clear()
+
+
+def bench_firestore_writes(iterations, query, nodes=500, latency=0.005):
+    import firebase
+
+    client = firebase.Firebase(firebase.InMemoryFirestore(latency=latency))
+    docs = [
+        {str(i): {"name": f"Concept {i}", "description": "A description. " * 8, "parent": "-1"}}
+        for i in range(nodes)
+    ]
+
+    def single_writes():
+        for data in docs:
+            client.write_data_to_collection("graph", query, data)
+
+    def batched_writes():
+        with client.batch() as batch:
+            for data in docs:
+                batch.write_data_to_collection("graph", query, data)
+
+    yield measure(f"firestore single writes ({nodes}, {latency * 1000:g} ms RPC)", single_writes, iterations, items=nodes)
+    yield measure(f"firestore batched writes ({nodes}, {latency * 1000:g} ms RPC)", batched_writes, iterations, items=nodes)
+
+
+def compare(results: list, previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {result["stage"]: result for result in json.load(f)["results"]}
+    print(f"\nvs {previous_path} (p50, lower is better):")
+    for result in results:
+        before = previous.get(result["stage"])
+        if before is not None:
+            print(f"{result['stage']:<32} x{before['p50_ms'] / result['p50_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("stages", nargs="*", help=f"any of {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server latency in seconds")
+    parser.add_argument("--output", default="stages.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    args.stages = args.stages or list(STAGES)
+
+    with open("superconductor.pdf", "rb") as f:
+        pdf = f.read()
+    with open("parsed.txt", encoding="utf-8") as f:
+        paper_text = f.read()
+    payloads = sample_payloads()
+    query = payloads[0].get("userQuery", "Language Models and Translation") if payloads else "query"
+
+    with FakeServer(latency=args.latency, pdfs={"/pdf/superconductor": pdf}) as fake, tempfile.TemporaryDirectory() as directory:
+        # Clients read their configuration at import time
+        os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+        os.environ["FIRESTORE_IN_MEMORY"] = "1"
+        os.environ["ARXIV_API_URL"] = fake.url + "/api/query"
+        os.environ["ARXIV_REQUESTS_PER_SECOND"] = "1000"
+        os.environ["ARXIV_BURST"] = "1000"
+        os.environ["ARXIV_INDEX_PATH"] = os.path.join(directory, "missing.sqlite3")
+        os.environ.pop("CASSETTE_PATH", None)
+
+        from bibliography import parse_bibliography
+
+        titles = [ref["title"] for ref in parse_bibliography(paper_text)]
+        titles += [paper["title"] for payload in payloads for paper in payload.get("papers", {}).get("papers", [])]
+
+        benches = {
+            "download_pdf": lambda: bench_download_pdf(args.iterations, fake.url, directory),
+            "pdf_to_text": lambda: bench_pdf_to_text(args.iterations),
+            "parse_insights": lambda: bench_parse_insights(args.iterations, paper_text),
+            "resolve_references": lambda: bench_resolve_references(args.iterations, titles),
+            "hydrate_node": lambda: bench_hydrate_node(args.iterations, query),
+            "firestore_writes": lambda: bench_firestore_writes(args.iterations, query),
+        }
+        results = []
+        for stage in args.stages:
+            results.extend(benches[stage]())
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "timestamp": time.time(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "fake_server_latency_s": args.latency,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
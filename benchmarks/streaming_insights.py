@@ -0,0 +1,88 @@
+"""Insight extraction followed by reference resolution vs overlapping the two.
+
+A local fake server streams a canned insights completion word by word and
+answers arXiv lookups with a fixed latency. The baseline waits for the whole
+completion before resolving the cited references; the streaming path starts
+each lookup as soon as its previous_work_idea closes:
+
+    python -m benchmarks.streaming_insights [token_delay_seconds] [arxiv_latency_seconds]
+"""
+import os
+import sys
+import time
+
+from benchmarks.fake_services import FakeServer
+from bibliography import parse_bibliography
+
+
+def canned_completion(bibliography: list, words_per_description: int = 60) -> str:
+    description = " ".join(["word"] * words_per_description)
+    ideas = [
+        f"""<previous_work_idea>
+    <idea_name>Idea {i}</idea_name>
+    <description>{description}</description>
+    <relevant_references><bibkey>{ref['bibkey']}</bibkey></relevant_references>
+</previous_work_idea>"""
+        for i, ref in enumerate(bibliography[:6])
+    ]
+    ideas += [
+        f"""<novel_idea>
+    <idea_name>Novel {i}</idea_name>
+    <description>{description}</description>
+</novel_idea>"""
+        for i in range(3)
+    ]
+    return "\n".join(ideas)
+
+
+if __name__ == "__main__":
+    token_delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.005
+    arxiv_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    with open("parsed.txt", encoding="utf-8") as f:
+        paper_text = f.read()
+    completion = canned_completion(parse_bibliography(paper_text))
+
+    with FakeServer(completion=completion, token_delay=token_delay) as claude_server, FakeServer(
+        latency=arxiv_latency
+    ) as arxiv_server:
+        # Both clients read their endpoints at import time
+        os.environ["ANTHROPIC_BASE_URL"] = claude_server.url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+        os.environ["ARXIV_INDEX_PATH"] = os.devnull + ".missing"
+        os.environ["ARXIV_API_URL"] = arxiv_server.url + "/api/query"
+        os.environ["ARXIV_REQUESTS_PER_SECOND"] = "1000"
+        os.environ["ARXIV_BURST"] = "1000"
+        import arxiv_script
+        from functions.insight_extraction import extract_key_insights_streaming
+
+        def cited_titles(insights):
+            titles = {ref["bibkey"]: ref["title"] for ref in insights["references"]}
+            return [
+                titles[idea["relevant_references"][0]]
+                for idea in insights["ideas"]
+                if idea["relevant_references"]
+            ]
+
+        start = time.perf_counter()
+        insights = extract_key_insights_streaming(paper_text)
+        generated = time.perf_counter() - start
+        arxiv_script.resolve_references(cited_titles(insights))
+        sequential = time.perf_counter() - start
+
+        arxiv_script.resolve_reference.cache_clear()
+        start = time.perf_counter()
+        with arxiv_script.ReferenceResolver() as resolver:
+            insights = extract_key_insights_streaming(
+                paper_text, on_citation=resolver.submit
+            )
+            urls = resolver.results(cited_titles(insights))
+        overlapped = time.perf_counter() - start
+
+    print(
+        f"{len(urls)} cited references, {token_delay * 1000:.0f} ms per delta, "
+        f"{arxiv_latency * 1000:.0f} ms arXiv latency"
+    )
+    print(f"generation alone:               {generated:.2f}s")
+    print(f"generate, then resolve:         {sequential:.2f}s")
+    print(f"resolve while generating:       {overlapped:.2f}s  speedup x{sequential / overlapped:.2f}")
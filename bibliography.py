@@ -0,0 +1,116 @@
+import re
+from typing import List
+
+from paper_sections import find_references_section
+
+# A paper needs at least this many parsed entries before we trust the parser
+# over having Claude write the reference list
+MIN_BIBLIOGRAPHY_ENTRIES = 3
+
+NUMBERED_ENTRY = re.compile(r"(?:^|\s)(?:\[(\d{1,3})\]|(\d{1,3})\.)\s+(?=[A-Z])")
+YEAR = re.compile(r"\b(1[89]\d\d|20\d\d)[a-z]?\b")
+# "H. K. Onnes," / "S. Guenon et al.," / "J. A. Flores -Livas et al.,"
+INITIALS_AUTHORS = re.compile(r"^(?:(?:[A-Z]\.\s?-?)+\s?[\w'\- ]+?(?:\s+et al\.)?,\s*)+")
+# "Vaswani, A., Shazeer, N., & Parmar, N. (2017)."
+APA_AUTHORS = re.compile(r"^.{0,400}?\((?:1[89]\d\d|20\d\d)[a-z]?\)\.\s*")
+# A full stop ending a sentence, not the one after an initial ("Quoc V. Le")
+SENTENCE_END = re.compile(r"(?<!\b[A-Z])\.\s+")
+# End of the first author: "Britz, ...", "Onnes and ...", "Le. Title"
+FIRST_AUTHOR_END = re.compile(r",|\s(?:and|&)\s|(?<!\b[A-Z])\.\s")
+NAME_TOKEN = re.compile(r"[^\W\d_][\w'\-]*")
+
+
+def clean_text(text: str) -> str:
+    # PyPDF2 puts a space before hyphens ("room -temperature")
+    return re.sub(r"\s+-", "-", " ".join(text.split()))
+
+
+def split_entries(references_text: str) -> List[str]:
+    # Numbered lists ("1. ...", "[1] ..."): entries must count up from 1 so that
+    # stray numbers inside entries (volumes, pages) are not taken as labels
+    entries = []
+    expected = 1
+    last_start = None
+    for match in NUMBERED_ENTRY.finditer(references_text):
+        number = int(match.group(1) or match.group(2))
+        if number != expected:
+            continue
+        if last_start is not None:
+            entries.append(references_text[last_start : match.start()])
+        last_start = match.end()
+        expected += 1
+    if last_start is not None:
+        # The last entry runs until the first blank line (acknowledgments etc.)
+        entries.append(re.split(r"\n\s*\n", references_text[last_start:])[0])
+    if len(entries) >= MIN_BIBLIOGRAPHY_ENTRIES:
+        return entries
+
+    # Unnumbered author-year lists: one entry per paragraph-ish block that
+    # starts with a capitalized surname
+    blocks = re.split(r"\n(?=[A-Z][A-Za-z'\-]+,\s)", references_text)
+    return [block for block in blocks if block.strip()]
+
+
+def entry_title(entry: str) -> str:
+    entry = clean_text(entry)
+    match = APA_AUTHORS.match(entry)
+    if match and len(entry) - match.end() > 10:
+        rest = entry[match.end() :]
+    else:
+        match = INITIALS_AUTHORS.match(entry)
+        if match:
+            rest = entry[match.end() :]
+        else:
+            # "First M. Last, First Last, and First Last. Title. Venue, 2017."
+            sentences = SENTENCE_END.split(entry, maxsplit=1)
+            rest = sentences[1] if len(sentences) > 1 else entry
+    title = SENTENCE_END.split(rest, maxsplit=1)[0].strip().rstrip(".")
+    return title
+
+
+def entry_bibkey(entry: str) -> str:
+    # First author's surname and the year: the last name token of the first
+    # author ("H. K. Onnes", "Denny Britz"), or the first one in
+    # surname-first lists ("Vaswani, A.")
+    entry = clean_text(entry)
+    match = FIRST_AUTHOR_END.search(entry, 0, 200)
+    first_author = entry[: match.start() if match else 200].replace("et al", "")
+    names = [name for name in NAME_TOKEN.findall(first_author) if len(name) > 1]
+    surname = re.sub(r"[^a-z]", "", names[-1].lower()) if names else ""
+    surname = surname or "ref"
+    years = YEAR.findall(entry)
+    return surname + (years[-1] if years else "")
+
+
+def parse_bibliography(paper_text: str) -> List[dict]:
+    span = find_references_section(paper_text)
+    if span is None:
+        return []
+    bibliography = []
+    used_bibkeys = set()
+    for entry in split_entries(paper_text[span[0] : span[1]]):
+        title = entry_title(entry)
+        if len(title) < 10:
+            # Kept under its full text so the model can still cite it
+            title = clean_text(entry)
+        if not title:
+            continue
+        bibkey = base = entry_bibkey(entry)
+        suffix = ord("a")
+        while bibkey in used_bibkeys:
+            bibkey = base + chr(suffix)
+            suffix += 1
+        used_bibkeys.add(bibkey)
+        bibliography.append(
+            {"bibkey": bibkey, "title": title, "reference_text": clean_text(entry)}
+        )
+    if len(bibliography) < MIN_BIBLIOGRAPHY_ENTRIES:
+        return []
+    return bibliography
+
+
+def format_bibliography(bibliography: List[dict]) -> str:
+    # Compact list for the prompt: the model only needs keys and titles
+    return "\n".join(
+        f"{i + 1}. [{ref['bibkey']}] {ref['title']}" for i, ref in enumerate(bibliography)
+    )
@@ -0,0 +1,313 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Gzipped JSON lines of recorded responses; unset disables record/replay
+CASSETTE_PATH = os.environ.get("CASSETTE_PATH", "")
+# "record" appends live responses to the cassette, "replay" serves only from it
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "replay")
+# "recorded", "none", "fixed:<s>", "uniform:<lo>,<hi>" or "lognormal:<median>,<sigma>"
+# for the time to the first byte; gaps between streamed chunks stay as recorded
+CASSETTE_LATENCY = os.environ.get("CASSETTE_LATENCY", "recorded")
+CASSETTE_SEED = int(os.environ.get("CASSETTE_SEED", 0))
+
+# Recorded after decoding, so the transfer headers no longer apply
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def _headers(headers: dict) -> dict:
+    return {name: value for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS}
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def request_key(method: str, url: str, body: Optional[bytes]) -> str:
+    # The host is left out so a cassette recorded against one endpoint
+    # replays against any other
+    parts = urlsplit(url)
+    digest = hashlib.sha256()
+    digest.update(f"{method.upper()} {parts.path}?{parts.query}\n".encode())
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+class LatencyModel:
+    def __init__(self, spec: str = CASSETTE_LATENCY, seed: int = CASSETTE_SEED):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(param) for param in params.split(",") if param]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        if kind not in ("recorded", "none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown cassette latency model: {spec}")
+
+    def delays(self, chunks: list) -> list:
+        # Seconds to wait before each chunk
+        offsets = [offset for offset, _ in chunks]
+        gaps = [later - earlier for earlier, later in zip(offsets, offsets[1:])]
+        if self.kind == "none":
+            return [0.0] * len(chunks)
+        if self.kind == "recorded":
+            first = offsets[0] if offsets else 0.0
+        else:
+            first = self._sample()
+        return [first] + gaps
+
+    def _sample(self) -> float:
+        with self.lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self.random.uniform(*self.params)
+            median, sigma = self.params
+            return self.random.lognormvariate(0, sigma) * median
+
+
+class Cassette:
+    def __init__(
+        self,
+        path: str = CASSETTE_PATH,
+        mode: str = CASSETTE_MODE,
+        latency: Optional[LatencyModel] = None,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency or LatencyModel()
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.replayed = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], []).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def lookup(self, key: str) -> dict:
+        # Repeated identical requests replay their recordings in order and
+        # then keep returning the last one
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response for request {key[:12]}")
+            self.hits += 1
+            index = self.replayed.get(key, 0)
+            self.replayed[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def record(self, key: str, status: int, headers: dict, chunks: list):
+        entry = {
+            "key": key,
+            "status": status,
+            "headers": _headers(headers),
+            # [seconds since the request was sent, base64 data]
+            "chunks": [
+                [round(offset, 4), base64.b64encode(data).decode()]
+                for offset, data in chunks
+            ],
+        }
+        with self.lock:
+            self.entries.setdefault(key, []).append(entry)
+            # Every entry is its own gzip member, which gzip.open reads back
+            # as one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def replay_chunks(self, entry: dict) -> list:
+        chunks = [(offset, base64.b64decode(data)) for offset, data in entry["chunks"]]
+        return list(zip(self.latency.delays(chunks), [data for _, data in chunks]))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "recordings": sum(len(entries) for entries in self.entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for delay, data in self.chunks:
+            if delay > 0:
+                time.sleep(delay)
+            yield data
+
+    async def __aiter__(self):
+        for delay, data in self.chunks:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield data
+
+
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    # Passes the live body through while timing each chunk; the entry is
+    # written once the body has been read to the end
+    def __init__(self, cassette: Cassette, key: str, response: httpx.Response, start: float):
+        self.cassette = cassette
+        self.key = key
+        self.response = response
+        self.start = start
+        self.chunks = []
+
+    def __iter__(self):
+        for data in self.response.iter_bytes():
+            self.chunks.append((time.perf_counter() - self.start, data))
+            yield data
+        self._record()
+
+    async def __aiter__(self):
+        async for data in self.response.aiter_bytes():
+            self.chunks.append((time.perf_counter() - self.start, data))
+            yield data
+        self._record()
+
+    def _record(self):
+        self.cassette.record(
+            self.key, self.response.status_code, dict(self.response.headers), self.chunks
+        )
+
+    def close(self):
+        self.response.close()
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.BaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request.method, str(request.url), request.read())
+        if self.cassette.replaying:
+            entry = self.cassette.lookup(key)
+            return httpx.Response(
+                entry["status"],
+                headers=entry["headers"],
+                stream=_ReplayStream(self.cassette.replay_chunks(entry)),
+            )
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        # Wrapped so the recording reads the body already decoded
+        response = httpx.Response(
+            response.status_code, headers=response.headers, stream=response.stream, request=request
+        )
+        return httpx.Response(
+            response.status_code,
+            headers=_headers(response.headers),
+            stream=_RecordingStream(self.cassette, key, response, start),
+        )
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request.method, str(request.url), await request.aread())
+        if self.cassette.replaying:
+            entry = self.cassette.lookup(key)
+            return httpx.Response(
+                entry["status"],
+                headers=entry["headers"],
+                stream=_ReplayStream(self.cassette.replay_chunks(entry)),
+            )
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        # Wrapped so the recording reads the body already decoded
+        response = httpx.Response(
+            response.status_code, headers=response.headers, stream=response.stream, request=request
+        )
+        return httpx.Response(
+            response.status_code,
+            headers=_headers(response.headers),
+            stream=_RecordingStream(self.cassette, key, response, start),
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class CassetteAdapter(HTTPAdapter):
+    # requests counterpart of CassetteTransport for the arXiv session
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        key = request_key(request.method, request.url, body)
+        if self.cassette.replaying:
+            entry = self.cassette.lookup(key)
+            content = b""
+            for delay, data in self.cassette.replay_chunks(entry):
+                if delay > 0:
+                    time.sleep(delay)
+                content += data
+            response = requests.Response()
+            response.status_code = entry["status"]
+            response.headers.update(entry["headers"])
+            response._content = content
+            # Lets iter_content() of a stream=True request serve the body
+            response._content_consumed = True
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            return response
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        # Reading the body here times the whole response as a single chunk
+        content = response.content
+        self.cassette.record(
+            key,
+            response.status_code,
+            dict(response.headers),
+            [(time.perf_counter() - start, content)],
+        )
+        return response
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    # Shared by the Claude and arXiv clients; None when CASSETTE_PATH is unset
+    global _cassette
+    if not CASSETTE_PATH:
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE)
+    return _cassette
@@ -1,11 +1,68 @@
-from typing import Optional
+import asyncio
+import os
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
 from dotenv import load_dotenv
 
-from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
+from anthropic import Anthropic, AsyncAnthropic, HUMAN_PROMPT, AI_PROMPT
+
+from cassette import AsyncCassetteTransport, CassetteTransport, get_cassette
+from tracing import record_tokens
 
 
 load_dotenv()  # take environment variables from .env.
-anthropic = Anthropic()  # defaults to os.environ.get("ANTHROPIC_API_KEY")
+# ANTHROPIC_BASE_URL lets us point both clients at a local stub completion server
+anthropic = Anthropic(
+    base_url=os.environ.get("ANTHROPIC_BASE_URL"),
+    transport=None if get_cassette() is None else CassetteTransport(get_cassette()),
+)  # defaults to os.environ.get("ANTHROPIC_API_KEY")
+
+# Process-wide cap on in-flight async completions
+CLAUDE_MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", 8))
+
+_async_anthropic = None
+_async_semaphore = None
+
+
+def get_async_anthropic() -> AsyncAnthropic:
+    # Created lazily so the pooled transport and the semaphore are shared by
+    # every AsyncClaude in the process
+    global _async_anthropic, _async_semaphore
+    if _async_anthropic is None:
+        limits = httpx.Limits(
+            max_connections=CLAUDE_MAX_CONCURRENCY,
+            max_keepalive_connections=CLAUDE_MAX_CONCURRENCY,
+        )
+        transport = None
+        if get_cassette() is not None:
+            # httpx ignores the pool limits once a transport is given
+            transport = AsyncCassetteTransport(
+                get_cassette(), httpx.AsyncHTTPTransport(limits=limits)
+            )
+        _async_anthropic = AsyncAnthropic(
+            base_url=os.environ.get("ANTHROPIC_BASE_URL"),
+            connection_pool_limits=limits,
+            transport=transport,
+        )
+        _async_semaphore = asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY)
+    return _async_anthropic
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    return anthropic.get_tokenizer()
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text).ids)
+
+
+async def _record_tokens_async(prompt: str, completion: str):
+    # Tokenizing a whole paper takes long enough to stall the event loop
+    counts = await asyncio.to_thread(lambda: (count_tokens(prompt), count_tokens(completion)))
+    record_tokens(*counts)
 
 
 class Claude:
@@ -26,13 +83,15 @@ class Claude:
         self.max_tokens_to_sample = max_tokens_to_sample
         self.temperature = temperature
         self.kwargs = kwargs
+        # Of the last completion: "stop_sequence", or "max_tokens" if cut off
+        self.stop_reason = None
 
-    def __call__(
+    def _build_prompt(
         self,
         prompt: str,
-        input_role_or_prefix: str = "user",
-        output_role_or_suffix: str = "assistant",
-    ) -> str:
+        input_role_or_prefix: str,
+        output_role_or_suffix: str,
+    ):
         if input_role_or_prefix == "user":
             prefix = HUMAN_PROMPT + " "
         elif input_role_or_prefix == "assistant":
@@ -47,26 +106,118 @@ class Claude:
         elif output_role_or_suffix == "assistant":
             suffix = " " + AI_PROMPT
         elif output_role_or_suffix is None:
-            output_role_or_suffix = ""
+            suffix = ""
         else:
             suffix = output_role_or_suffix
 
         input_prompt = "".join(self.messages) + prefix + prompt + suffix
+        return prefix, suffix, input_prompt
 
-        completion = anthropic.completions.create(
+    def _completion_args(self, input_prompt: str) -> dict:
+        return dict(
             prompt=input_prompt,
             model=self.model,
             max_tokens_to_sample=self.max_tokens_to_sample,
             temperature=self.temperature,
             **self.kwargs,
-        ).completion
+        )
 
+    def _record(self, prefix: str, prompt: str, suffix: str, completion: str):
         if self.keep_state:
             self.messages.append(prefix + prompt)
             self.messages.append(suffix + completion)
 
+    def __call__(
+        self,
+        prompt: str,
+        input_role_or_prefix: str = "user",
+        output_role_or_suffix: str = "assistant",
+    ) -> str:
+        prefix, suffix, input_prompt = self._build_prompt(
+            prompt, input_role_or_prefix, output_role_or_suffix
+        )
+
+        response = anthropic.completions.create(**self._completion_args(input_prompt))
+        completion = response.completion
+        self.stop_reason = response.stop_reason
+
+        record_tokens(count_tokens(input_prompt), count_tokens(completion))
+        self._record(prefix, prompt, suffix, completion)
         return completion
 
+    def stream(
+        self,
+        prompt: str,
+        input_role_or_prefix: str = "user",
+        output_role_or_suffix: str = "assistant",
+    ) -> Iterator[str]:
+        # Yields completion deltas as they arrive; the exchange is only
+        # recorded once the whole completion has been received
+        prefix, suffix, input_prompt = self._build_prompt(
+            prompt, input_role_or_prefix, output_role_or_suffix
+        )
+
+        deltas = []
+        self.stop_reason = None
+        for event in anthropic.completions.create(
+            stream=True, **self._completion_args(input_prompt)
+        ):
+            deltas.append(event.completion)
+            self.stop_reason = event.stop_reason or self.stop_reason
+            yield event.completion
+
+        completion = "".join(deltas)
+        record_tokens(count_tokens(input_prompt), count_tokens(completion))
+        self._record(prefix, prompt, suffix, completion)
+
+
+class AsyncClaude(Claude):
+    async def __call__(
+        self,
+        prompt: str,
+        input_role_or_prefix: str = "user",
+        output_role_or_suffix: str = "assistant",
+    ) -> str:
+        prefix, suffix, input_prompt = self._build_prompt(
+            prompt, input_role_or_prefix, output_role_or_suffix
+        )
+
+        client = get_async_anthropic()
+        async with _async_semaphore:
+            response = await client.completions.create(**self._completion_args(input_prompt))
+        completion = response.completion
+        self.stop_reason = response.stop_reason
+
+        await _record_tokens_async(input_prompt, completion)
+        self._record(prefix, prompt, suffix, completion)
+        return completion
+
+    async def stream(
+        self,
+        prompt: str,
+        input_role_or_prefix: str = "user",
+        output_role_or_suffix: str = "assistant",
+    ) -> AsyncIterator[str]:
+        prefix, suffix, input_prompt = self._build_prompt(
+            prompt, input_role_or_prefix, output_role_or_suffix
+        )
+
+        client = get_async_anthropic()
+        deltas = []
+        self.stop_reason = None
+        async with _async_semaphore:
+            events = await client.completions.create(
+                stream=True, **self._completion_args(input_prompt)
+            )
+            async for event in events:
+                deltas.append(event.completion)
+                self.stop_reason = event.stop_reason or self.stop_reason
+                yield event.completion
+
+        completion = "".join(deltas)
+        await _record_tokens_async(input_prompt, completion)
+        self._record(prefix, prompt, suffix, completion)
+
 
 if __name__ == "__main__":
     chat = Claude()
@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from firebase import get_firestore_client
+from shared_state import get_shared_state
+
+CONCEPT_STORE_MAX_ENTRIES = int(os.environ.get("CONCEPT_STORE_MAX_ENTRIES", 100_000))
+# Seconds a concept stays in memory after it was stored; 0 keeps it until evicted
+CONCEPT_STORE_TTL = float(os.environ.get("CONCEPT_STORE_TTL", 6 * 60 * 60))
+
+
+class Concept:
+    # The fields hydrate_node reads, without the pydantic per-instance
+    # __dict__ and fields-set bookkeeping. URLs and ids repeat across nodes
+    # (every novel idea of a paper shares its URL, siblings share a parent)
+    # and are interned so each is held once
+    __slots__ = ("id", "name", "description", "referenceUrl", "referenceText", "parent", "stored_at")
+
+    def __init__(self, id, name, description, referenceUrl, referenceText, parent, stored_at):
+        self.id = sys.intern(id)
+        self.name = name
+        self.description = description
+        self.referenceUrl = sys.intern(referenceUrl or "")
+        self.referenceText = referenceText or ""
+        self.parent = sys.intern(parent or "")
+        self.stored_at = stored_at
+
+    @classmethod
+    def from_fields(cls, fields, stored_at: float) -> "Concept":
+        # fields is a ConceptNode or the dict(concept) written to Firestore
+        get = fields.get if isinstance(fields, dict) else lambda name: getattr(fields, name, None)
+        return cls(
+            get("id"),
+            get("name"),
+            get("description"),
+            get("referenceUrl"),
+            get("referenceText"),
+            get("parent"),
+            stored_at,
+        )
+
+    def fields(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__[:-1]}
+
+
+class ConceptStore:
+    # Bounded LRU of graph concepts, written through to the shared state when
+    # one is configured so other workers can hydrate them. Concepts missing
+    # from both are reloaded from the query's Firestore graph document
+    def __init__(
+        self,
+        max_entries: int = CONCEPT_STORE_MAX_ENTRIES,
+        ttl: float = CONCEPT_STORE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.concepts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def put(self, concept):
+        concept = Concept.from_fields(concept, time.monotonic())
+        self._insert(concept)
+        state = get_shared_state()
+        if state is not None:
+            state.set(f"concept:{concept.id}", json.dumps(concept.fields()), self.ttl or None)
+
+    def get(self, concept_id: str, query: Optional[str] = None) -> Concept:
+        with self.lock:
+            concept = self._lookup(concept_id)
+            if concept is not None:
+                self.hits += 1
+                return concept
+            self.misses += 1
+        state = get_shared_state()
+        fields = state.get(f"concept:{concept_id}") if state is not None else None
+        if fields is not None:
+            concept = Concept.from_fields(json.loads(fields), time.monotonic())
+            self._insert(concept)
+            return concept
+        if query is not None and self._reload(concept_id, query):
+            with self.lock:
+                concept = self._lookup(concept_id)
+            if concept is not None:
+                return concept
+        raise KeyError(concept_id)
+
+    def _lookup(self, concept_id: str) -> Optional[Concept]:
+        concept = self.concepts.get(concept_id)
+        if concept is None:
+            return None
+        if self.ttl and time.monotonic() - concept.stored_at > self.ttl:
+            del self.concepts[concept_id]
+            self.evictions += 1
+            return None
+        self.concepts.move_to_end(concept_id)
+        return concept
+
+    def _reload(self, concept_id: str, query: str) -> bool:
+        # The whole graph document comes back in one read, so the rest of it
+        # is stored too for the lookups that usually follow
+        graph = get_firestore_client().read_from_document("graph", query) or {}
+        if concept_id not in graph:
+            return False
+        now = time.monotonic()
+        for fields in graph.values():
+            if fields.get("id") != concept_id:
+                self._insert(Concept.from_fields(fields, now))
+        self._insert(Concept.from_fields(graph[concept_id], now))
+        with self.lock:
+            self.reloads += 1
+        return True
+
+    def _insert(self, concept: Concept):
+        with self.lock:
+            self.concepts[concept.id] = concept
+            self.concepts.move_to_end(concept.id)
+            while len(self.concepts) > self.max_entries:
+                self.concepts.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, concept_id: str) -> bool:
+        with self.lock:
+            return self._lookup(concept_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.concepts)
+
+    def clear(self):
+        with self.lock:
+            self.concepts.clear()
+
+    def stats(self) -> dict:
+        return {
+            "concepts": len(self.concepts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+        }
@@ -1,13 +1,51 @@
+import atexit
+import copy
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from tracing import annotate, traced
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_MAX_BATCH_WRITES = 500
+# Hand batched writes to a background flusher instead of committing inline
+FIRESTORE_WRITE_BEHIND = os.environ.get("FIRESTORE_WRITE_BEHIND", "0") == "1"
+FIRESTORE_WRITE_BEHIND_MAX_PENDING = int(
+    os.environ.get("FIRESTORE_WRITE_BEHIND_MAX_PENDING", 1000)
+)
+# Use an in-process stand-in instead of the real Firestore (no credentials needed)
+FIRESTORE_IN_MEMORY = os.environ.get("FIRESTORE_IN_MEMORY", "0") == "1"
+
+
+def merge_into(target: dict, data: dict):
+    # Same semantics as set(..., merge=True): nested maps merge, other values overwrite
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_into(target[key], value)
+        else:
+            target[key] = value
+
 
 class Firebase:
-    def __init__(self):
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-        self.db = firestore.client()
+    def __init__(self, db=None):
+        if db is None:
+            cred = credentials.Certificate("serviceAccountKey.json")
+            firebase_admin.initialize_app(cred)
+            db = firestore.client()
+        self.db = db
+        # listener(collection_name, document_name), called once a write to
+        # the document has landed, inline or from the write-behind thread
+        self.commit_listeners = []
+        self.write_behind = None
+        if FIRESTORE_WRITE_BEHIND:
+            self.write_behind = WriteBehindQueue(self)
 
+    @traced("firestore_read")
     def read_from_document(self, collection_name: str, document_name: str):
         doc_ref = self.db.collection(collection_name).document(document_name)
         doc_snapshot = doc_ref.get()
@@ -19,12 +57,43 @@ class Firebase:
             # Document does not exist
             return None
 
+    @traced("firestore_write")
     def write_data_to_collection(self, collection_name: str, document_name: str, data):
         # print(collection_name, document_name, data)
         collection_ref = self.db.collection(collection_name)
         doc_ref = collection_ref.document(document_name)
         doc_ref.set(dict(data), merge=True)
         # print(f"Document added: {doc_ref}")
+        self._committed([(collection_name, document_name)])
+
+    def batch(self) -> "WriteBatch":
+        return WriteBatch(self)
+
+    @traced("firestore_write")
+    def commit_writes(self, writes: dict):
+        # writes maps (collection_name, document_name) -> merged data
+        items = list(writes.items())
+        annotate(documents=len(items))
+        for start in range(0, len(items), FIRESTORE_MAX_BATCH_WRITES):
+            chunk = items[start : start + FIRESTORE_MAX_BATCH_WRITES]
+            batch = self.db.batch()
+            for (collection_name, document_name), data in chunk:
+                doc_ref = self.db.collection(collection_name).document(document_name)
+                batch.set(doc_ref, data, merge=True)
+            batch.commit()
+            self._committed(key for key, _ in chunk)
+
+    def on_commit(self, listener):
+        self.commit_listeners.append(listener)
+
+    def _committed(self, keys):
+        for collection_name, document_name in keys:
+            for listener in self.commit_listeners:
+                listener(collection_name, document_name)
+
+    def flush(self):
+        if self.write_behind is not None:
+            self.write_behind.flush()
 
     def delete_data_from_collection(self, collection_name, document_id):
         try:
@@ -37,7 +106,158 @@ class Firebase:
             print(f"An error occurred: {e}")
 
 
-firestore_client = Firebase()
+class WriteBatch:
+    # Collects writes grouped per document and commits them in one batch,
+    # either inline or through the client's write-behind queue
+    def __init__(self, firebase: Firebase):
+        self.firebase = firebase
+        self.writes = {}
+
+    def write_data_to_collection(self, collection_name: str, document_name: str, data):
+        # Copied so later mutations of the caller's objects don't leak into the commit
+        merge_into(
+            self.writes.setdefault((collection_name, document_name), {}),
+            copy.deepcopy(dict(data)),
+        )
+
+    def commit(self):
+        writes, self.writes = self.writes, {}
+        if not writes:
+            return
+        if self.firebase.write_behind is not None:
+            self.firebase.write_behind.put(writes)
+        else:
+            self.firebase.commit_writes(writes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.commit()
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        firebase: Firebase,
+        max_pending: int = FIRESTORE_WRITE_BEHIND_MAX_PENDING,
+    ):
+        self.firebase = firebase
+        # Bounded: producers block once max_pending batches are waiting
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def put(self, writes: dict):
+        self.pending.put(writes)
+
+    def _run(self):
+        while True:
+            writes = self.pending.get()
+            # Coalesce whatever else is queued into the same commit
+            batches = [writes]
+            while True:
+                try:
+                    batches.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            merged = {}
+            for batch in batches:
+                for key, data in batch.items():
+                    merge_into(merged.setdefault(key, {}), data)
+            try:
+                self.firebase.commit_writes(merged)
+            except Exception as e:
+                print(f"Write-behind flush failed: {e}")
+            finally:
+                for _ in batches:
+                    self.pending.task_done()
+
+    def flush(self):
+        self.pending.join()
+
+
+class InMemoryFirestore:
+    # Enough of the Firestore client surface for the Firebase wrapper;
+    # latency is slept once per commit to stand in for the RPC
+    def __init__(self, latency: float = 0.0):
+        self.documents = {}
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.latency = latency
+
+    def collection(self, collection_name: str):
+        return _InMemoryCollection(self, collection_name)
+
+    def batch(self):
+        return _InMemoryBatch(self)
+
+
+class _InMemoryCollection:
+    def __init__(self, store: InMemoryFirestore, name: str):
+        self.store = store
+        self.name = name
+
+    def document(self, document_name: str):
+        return _InMemoryDocument(self.store, (self.name, document_name))
+
+
+class _InMemoryDocument:
+    def __init__(self, store: InMemoryFirestore, key: tuple):
+        self.store = store
+        self.key = key
+
+    def get(self):
+        with self.store.lock:
+            data = self.store.documents.get(self.key)
+            return _InMemorySnapshot(copy.deepcopy(data))
+
+    def set(self, data: dict, merge: bool = False):
+        time.sleep(self.store.latency)
+        with self.store.lock:
+            self.store.commits += 1
+            self._set(data, merge)
+
+    def _set(self, data: dict, merge: bool):
+        data = copy.deepcopy(data)
+        if merge and self.key in self.store.documents:
+            merge_into(self.store.documents[self.key], data)
+        else:
+            self.store.documents[self.key] = {}
+            merge_into(self.store.documents[self.key], data)
+
+    def delete(self):
+        with self.store.lock:
+            self.store.documents.pop(self.key, None)
+
+
+class _InMemorySnapshot:
+    def __init__(self, data: Optional[dict]):
+        self.data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return self.data
+
+
+class _InMemoryBatch:
+    def __init__(self, store: InMemoryFirestore):
+        self.store = store
+        self.writes = []
+
+    def set(self, doc_ref: _InMemoryDocument, data: dict, merge: bool = False):
+        self.writes.append((doc_ref, data, merge))
+
+    def commit(self):
+        time.sleep(self.store.latency)
+        with self.store.lock:
+            self.store.commits += 1
+            for doc_ref, data, merge in self.writes:
+                doc_ref._set(data, merge)
+
+
+firestore_client = Firebase(InMemoryFirestore() if FIRESTORE_IN_MEMORY else None)
 
 
 def get_firestore_client():
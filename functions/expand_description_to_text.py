@@ -1,13 +1,13 @@
-from functools import lru_cache
+from claude import AsyncClaude, Claude
+from passage_index import relevant_passages
+from shared_state import shared_cache
+from tracing import traced
+from xml_parser import parse_tags
 
-from claude import Claude
 
-@lru_cache(maxsize=1000)
-def expand(orig_description, paper):
-    expander = Claude()
-    expanded = expander(
-        f"""
-            My user wants to learn about a key concept from a paper. In order to do this, I am going to give you a description of a key concept from a paper. I am also going to give you the text of the paper.
+def _expand_prompt(orig_description, passages):
+    return f"""
+            My user wants to learn about a key concept from a paper. In order to do this, I am going to give you a description of a key concept from a paper. I am also going to give you the passages of the paper most related to it.
             I want you to return an expanded (8-9 sentence) description of the key concept. This description should be informative and educational, and teach the user about the key concept as well as how it is applied in the given paper.
             I also want you to return a 3-5 word name for the key concept.
 
@@ -19,9 +19,9 @@ def expand(orig_description, paper):
                 orig_description
             }
 
-            The paper text is:
+            The passages from the paper, separated by "...", are:
             <text>
-            {paper}
+            {passages}
             </text>
 
             Your final response should look like this:
@@ -30,16 +30,10 @@ def expand(orig_description, paper):
             <name> (NAME of the concept) </name>
             </response>
         """
-    )
-    response = expanded
-    description = response.split("<description>")[1].split("</description>")[0].replace("'", "\"")
-    return description
 
-@lru_cache(maxsize=1000)
-def expand_without_paper(orig_description):
-    expander = Claude()
-    expanded = expander(
-        f"""
+
+def _expand_without_paper_prompt(orig_description):
+    return f"""
             My user wants to learn about a key concept. In order to do this, I am going to give you a description of a key concept from a paper.
             I want you to return an expanded (8-9 sentence) description of the key concept. This description should be informative and educational, and teach the user about the key concept as well as how it is applied in research.
             I also want you to return a 3-5 word name for the key concept.
@@ -58,7 +52,49 @@ def expand_without_paper(orig_description):
             <name> (NAME of the concept) </name>
             </response>
         """
+
+
+def _parse_description(response):
+    description = parse_tags(response).findtext("description")
+    if description is None:
+        raise ValueError("Description could not be parsed")
+    return description.replace("'", "\"")
+
+
+def expand(orig_description, paper):
+    # Only the passages that match the description go into the prompt, which
+    # also keeps the cache key small
+    return expand_passages(orig_description, relevant_passages(paper, orig_description))
+
+
+@traced("expand", cache=shared_cache("expand_passages", maxsize=1000))
+def expand_passages(orig_description, passages):
+    expander = Claude()
+    expanded = expander(_expand_prompt(orig_description, passages))
+    return _parse_description(expanded)
+
+@traced("expand", cache=shared_cache("expand_without_paper", maxsize=1000))
+def expand_without_paper(orig_description):
+    expander = Claude()
+    expanded = expander(_expand_without_paper_prompt(orig_description))
+    return _parse_description(expanded)
+
+
+async def expand_async(orig_description, paper):
+    return await expand_passages_async(
+        orig_description, relevant_passages(paper, orig_description)
     )
-    response = expanded
-    description = response.split("<description>")[1].split("</description>")[0].replace("'", "\"")
-    return description
+
+
+@traced("expand", cache=shared_cache("expand_passages", maxsize=1000))
+async def expand_passages_async(orig_description, passages):
+    expander = AsyncClaude()
+    expanded = await expander(_expand_prompt(orig_description, passages))
+    return _parse_description(expanded)
+
+
+@traced("expand", cache=shared_cache("expand_without_paper", maxsize=1000))
+async def expand_without_paper_async(orig_description):
+    expander = AsyncClaude()
+    expanded = await expander(_expand_without_paper_prompt(orig_description))
+    return _parse_description(expanded)
@@ -1,67 +1,106 @@
-from functools import lru_cache
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 from anthropic import AI_PROMPT
 
-from claude import Claude
-from xml_parser import extract_tag_content
+from bibliography import format_bibliography, parse_bibliography
+from claude import Claude, count_tokens, get_tokenizer
+from paper_sections import find_references_section, is_appendix, split_sections
+from shared_state import shared_cache
+from tracing import propagate, traced
+from xml_parser import Element, TagParser
 
+# Papers over this many tokens are extracted chunk by chunk and merged
+INSIGHTS_TOKEN_BUDGET = int(os.environ.get("INSIGHTS_TOKEN_BUDGET", 60_000))
+INSIGHTS_CHUNK_WORKERS = int(os.environ.get("INSIGHTS_CHUNK_WORKERS", 4))
+MAX_NOVEL_IDEAS = 3
+MAX_PREVIOUS_WORK_IDEAS = 6
 
-def parse_insights(insights_text: str) -> dict:
-    output = {}
-    [references] = extract_tag_content(insights_text, tag="references")
-    references = extract_tag_content(insights_text, tag="bibitem")
-    reference_list = []
-    for ref in references:
-        [bibkey] = extract_tag_content(ref, tag="bibkey")
-        bibkey = bibkey.strip()
-        bibkey = bibkey.strip("\n")
-        bibkey = bibkey.strip("\\n")
-        bibkey = bibkey.strip()
-        [reference_text] = extract_tag_content(ref, tag="reference_text")
-        [title] = extract_tag_content(ref, tag="title")
-        reference_list.append(
-            {"bibkey": bibkey, "reference_text": reference_text, "title": title}
-        )
-    output["references"] = reference_list
-    new_ideas = extract_tag_content(insights_text, tag="novel_idea")
-    idea_list = []
-    for idea in new_ideas:
-        [idea_name] = extract_tag_content(idea, tag="idea_name")
-        [description] = extract_tag_content(idea, tag="description")
-        idea_list.append(
-            {
-                "idea_name": idea_name,
-                "description": description,
-                "relevant_references": [],
-            }
-        )
-    previous_work_ideas = extract_tag_content(insights_text, tag="previous_work_idea")
-    for idea in previous_work_ideas:
-        [idea_name] = extract_tag_content(idea, tag="idea_name")
-        [description] = extract_tag_content(idea, tag="description")
-        relevant_references = extract_tag_content(idea, tag="relevant_references")
+
+INSIGHT_TAGS = ("bibitem", "novel_idea", "previous_work_idea")
+
+
+def _clean_bibkey(bibkey: str) -> str:
+    # Keys are sometimes copied with the reference list's brackets
+    bibkey = bibkey.strip().strip("\n").strip("\\n").strip()
+    if bibkey.startswith("[") and bibkey.endswith("]"):
+        bibkey = bibkey[1:-1].strip()
+    return bibkey
+
+
+def reference_from_element(element: Element) -> Optional[dict]:
+    bibkey = element.findtext("bibkey")
+    if bibkey is None:
+        return None
+    return {
+        "bibkey": _clean_bibkey(bibkey),
+        "reference_text": element.findtext("reference_text", ""),
+        "title": element.findtext("title", ""),
+    }
+
+
+def idea_from_element(element: Element) -> Optional[dict]:
+    # Ideas cut off before their closing tag, or with an unclosed name or
+    # description, are dropped rather than stored half-written
+    if not element.complete:
+        return None
+    name_element = element.find("idea_name")
+    description_element = element.find("description")
+    if (
+        name_element is None
+        or description_element is None
+        or not name_element.complete
+        or not description_element.complete
+    ):
+        return None
+    idea_name = name_element.text
+    description = description_element.text
+    if not idea_name or not description:
+        return None
+    relevant_references = []
+    if element.tag == "previous_work_idea":
         relevant_references = [
-            extract_tag_content(ref, tag="bibkey")[0]
-            .strip()
-            .strip("\n")
-            .strip("\\n")
-            .strip()
-            for ref in relevant_references
+            _clean_bibkey(bibkey.text)
+            for references in element.iter("relevant_references")
+            for bibkey in references.iter("bibkey")
         ]
-        idea_list.append(
-            {
-                "idea_name": idea_name,
-                "description": description,
-                "relevant_references": relevant_references,
-            }
-        )
-    output["ideas"] = idea_list
-    return output
-
-
-@lru_cache(maxsize=1000)
-def extract_key_insights(paper_text: str) -> dict:
-    prompt = f"""List the most important ideas in the paper separate totally novel ideas
+    return {
+        "idea_name": idea_name,
+        "description": description,
+        "relevant_references": relevant_references,
+    }
+
+
+def parse_insights(insights_text: str, bibliography: Optional[list] = None) -> dict:
+    # With a locally parsed bibliography the completion only cites its bibkeys.
+    # Truncated output yields whatever elements were complete.
+    parser = TagParser(INSIGHT_TAGS)
+    elements = parser.feed(insights_text) + parser.close()
+    reference_list = []
+    novel_ideas, previous_work_ideas = [], []
+    for element in elements:
+        if element.tag == "bibitem":
+            ref = reference_from_element(element)
+            if ref is not None and bibliography is None:
+                reference_list.append(ref)
+            continue
+        idea = idea_from_element(element)
+        if idea is None:
+            continue
+        if element.tag == "novel_idea":
+            novel_ideas.append(idea)
+        else:
+            previous_work_ideas.append(idea)
+    return {
+        "references": reference_list if bibliography is None else bibliography,
+        "ideas": novel_ideas + previous_work_ideas,
+    }
+
+
+def _insights_prompt(paper_text: str) -> str:
+    return f"""List the most important ideas in the paper separate totally novel ideas
     from those that build upon previous work (both are VERY important) and then output the list of ideas in the following format:
     <references>
         <bibitem>
@@ -116,8 +155,75 @@ def extract_key_insights(paper_text: str) -> dict:
 
     {AI_PROMPT} I have identified the paper's title and authors and will ignore it, beyond that, these are the most important references from previous work:
     """
-    insights = Claude()(prompt, output_role_or_suffix="")
 
+
+def _cited_insights_prompt(paper_text: str) -> str:
+    return f"""List the most important ideas in the paper separate totally novel ideas
+    from those that build upon previous work (both are VERY important) and then output the list of ideas in the following format:
+    <previous_work_idea>
+        <idea_name>
+            # A 3-4 word name for the idea
+        </idea_name>
+        <description>
+            # Description of the idea
+        </description>
+        <relevant_references>
+            <bibkey>
+                # Bibkey of the relevant reference: the key inside the [brackets] of the paper's reference list, without them
+            </bibkey>
+            ...
+            <bibkey>
+            ...
+            </bibkey>
+        </relevant_references>
+    </previous_work_idea>
+    ...
+    <previous_work_idea>
+    ...
+    </previous_work_idea>
+    <novel_idea>
+        <idea_name>
+            # A 3-4 word name for the idea
+        </idea_name>
+        <description>
+            # Description of the idea
+        </description>
+    </novel_idea>
+    ...
+    <novel_idea>
+        ...
+    </novel_idea>
+    Do not repeat the reference list, only cite its bibkeys.
+    === Paper text ===
+    {paper_text}
+
+    Aim for 4-6 previous work ideas and 2-3 novel ideas.
+
+    {AI_PROMPT} I have identified the paper's title and authors and will ignore it, beyond that, these are the most important ideas that build on previous work, citing the bibkeys from the reference list:
+    """
+
+
+# Changes whenever the prompt template does, so stored insights from an older
+# prompt are never served
+INSIGHTS_PROMPT_VERSION = hashlib.sha256(
+    (_insights_prompt("") + _cited_insights_prompt("")).encode()
+).hexdigest()[:12]
+
+
+def _prepare_paper(paper_text: str):
+    # Swap the raw reference list for a compact "[bibkey] title" list so the
+    # model cites keys instead of re-typing every reference as XML. Papers whose
+    # bibliography can't be parsed keep the original prompt.
+    bibliography = parse_bibliography(paper_text)
+    if not bibliography:
+        return paper_text, None, _insights_prompt
+    span = find_references_section(paper_text)
+    body = paper_text[: span[0]] + paper_text[span[1] :]
+    paper_text = f"{body}\n\nReferences\n{format_bibliography(bibliography)}\n"
+    return paper_text, bibliography, _cited_insights_prompt
+
+
+def _log_and_parse_insights(insights: str, bibliography: Optional[list] = None) -> dict:
     try:
         with open("claude_insights_logs.txt", "a", encoding="utf-8") as f:
             f.write(insights + "\n")
@@ -125,9 +231,206 @@ def extract_key_insights(paper_text: str) -> dict:
         pass
 
     try:
-        parsed_insights = parse_insights(insights)
+        parsed_insights = parse_insights(insights, bibliography)
     except Exception as e:
         print(f"Failed with:\n{insights}")
         raise e
     # print(parsed_insights)
     return parsed_insights
+
+
+def _stream_insights(
+    prompt_text: str,
+    bibliography: Optional[list],
+    on_citation: Optional[Callable[[str], None]],
+) -> dict:
+    # Streams the completion and calls on_citation(title) for the first cited
+    # reference of every previous_work_idea as soon as the idea closes
+    parser = TagParser(INSIGHT_TAGS)
+    titles = {ref["bibkey"]: ref["title"] for ref in bibliography or []}
+
+    def handle(elements):
+        for element in elements:
+            if element.tag == "bibitem" and bibliography is None:
+                ref = reference_from_element(element)
+                if ref is not None:
+                    titles[ref["bibkey"]] = ref["title"]
+            elif element.tag == "previous_work_idea" and on_citation is not None:
+                idea = idea_from_element(element)
+                if idea and idea["relevant_references"]:
+                    title = titles.get(idea["relevant_references"][0])
+                    if title is not None:
+                        on_citation(title)
+
+    deltas = []
+    claude = Claude()
+    for delta in claude.stream(prompt_text, output_role_or_suffix=""):
+        deltas.append(delta)
+        handle(parser.feed(delta))
+    handle(parser.close())
+    insights = _log_and_parse_insights("".join(deltas), bibliography)
+    if claude.stop_reason == "max_tokens":
+        insights["partial"] = True
+    return insights
+
+
+def is_complete(insights: dict) -> bool:
+    # Insights worth storing: the completion wasn't cut off, every chunk
+    # succeeded and at least one idea came out of it
+    return bool(insights["ideas"]) and not insights.get("partial")
+
+
+@traced(
+    "extract_key_insights",
+    cache=shared_cache("extract_key_insights", maxsize=1000, version=INSIGHTS_PROMPT_VERSION),
+)
+def extract_key_insights(paper_text: str) -> dict:
+    return _extract_key_insights(paper_text)
+
+
+@traced("extract_key_insights")
+def extract_key_insights_streaming(
+    paper_text: str, on_citation: Optional[Callable[[str], None]] = None
+) -> dict:
+    return _extract_key_insights(paper_text, on_citation)
+
+
+def _extract_key_insights(
+    paper_text: str, on_citation: Optional[Callable[[str], None]] = None
+) -> dict:
+    paper_text, bibliography, prompt = _prepare_paper(paper_text)
+    chunks = chunk_paper(paper_text)
+    if chunks is None:
+        return _stream_insights(prompt(paper_text), bibliography, on_citation)
+
+    def extract_chunk(chunk):
+        return _stream_insights(prompt(chunk), bibliography, on_citation)
+
+    with ThreadPoolExecutor(max_workers=INSIGHTS_CHUNK_WORKERS) as executor:
+        futures = [executor.submit(propagate(extract_chunk), chunk) for chunk in chunks]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return merge_chunk_insights(results)
+
+
+def chunk_paper(paper_text: str, budget: int = INSIGHTS_TOKEN_BUDGET):
+    # None when the paper fits the budget and should take the single-call path
+    if count_tokens(paper_text) <= budget:
+        return None
+
+    # Every chunk carries the reference list so bibkeys stay consistent
+    span = find_references_section(paper_text)
+    references_text = ""
+    body = paper_text
+    if span is not None:
+        references_text = paper_text[span[0] : span[1]]
+        body = paper_text[: span[0]] + paper_text[span[1] :]
+        references_text = truncate_to_tokens(references_text, budget // 2)
+    # Headroom for the part header and tokens merging across line boundaries
+    chunk_budget = budget - count_tokens(references_text) - 64
+
+    pieces = []
+    for heading, section in split_sections(body):
+        if is_appendix(heading):
+            continue
+        pieces.extend(split_to_budget(section, chunk_budget))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > chunk_budget:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+
+    return [
+        f"(Part {i + 1} of {len(chunks)} of the paper)\n{chunk}\n\nReferences\n{references_text}"
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def split_to_budget(section: str, budget: int) -> list:
+    # (text, tokens) pieces of at most budget tokens, cut on line boundaries
+    tokens = count_tokens(section)
+    if tokens <= budget:
+        return [(section, tokens)]
+    lines = section.splitlines(keepends=True)
+    line_tokens = [len(encoding.ids) for encoding in get_tokenizer().encode_batch(lines)]
+    pieces = []
+    current, current_tokens = [], 0
+    for line, tokens in zip(lines, line_tokens):
+        if current and current_tokens + tokens > budget:
+            pieces.append(("".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        pieces.append(("".join(current), current_tokens))
+    return pieces
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = get_tokenizer().encode(text)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    return text[: encoding.offsets[max_tokens - 1][1]]
+
+
+def merge_chunk_insights(results: list) -> dict:
+    # Chunks name references independently, so references are matched by title
+    # and each chunk's bibkeys are rewritten to the first key seen for that title
+    errors = [result for result in results if isinstance(result, Exception)]
+    parsed = [result for result in results if not isinstance(result, Exception)]
+    for error in errors:
+        print(f"Chunk insight extraction failed: {error}")
+    if not parsed:
+        raise errors[0]
+    partial = bool(errors) or any(insights.get("partial") for insights in parsed)
+
+    references = []
+    bibkey_by_title = {}
+    used_bibkeys = set()
+    novel_ideas, previous_work_ideas = [], []
+    seen_ideas = set()
+    for insights in parsed:
+        local_bibkeys = {}
+        for ref in insights["references"]:
+            title = " ".join(ref["title"].lower().split())
+            if title not in bibkey_by_title:
+                bibkey = ref["bibkey"]
+                while bibkey in used_bibkeys:
+                    bibkey += "_"
+                used_bibkeys.add(bibkey)
+                bibkey_by_title[title] = bibkey
+                references.append(dict(ref, bibkey=bibkey))
+            local_bibkeys[ref["bibkey"]] = bibkey_by_title[title]
+
+        for idea in insights["ideas"]:
+            name = " ".join(idea["idea_name"].lower().split())
+            if name in seen_ideas:
+                continue
+            seen_ideas.add(name)
+            relevant_references = [
+                local_bibkeys.get(bibkey, bibkey) for bibkey in idea["relevant_references"]
+            ]
+            idea = dict(idea, relevant_references=relevant_references)
+            if relevant_references:
+                previous_work_ideas.append(idea)
+            else:
+                novel_ideas.append(idea)
+
+    merged = {
+        "references": references,
+        "ideas": novel_ideas[:MAX_NOVEL_IDEAS]
+        + previous_work_ideas[:MAX_PREVIOUS_WORK_IDEAS],
+    }
+    if partial:
+        merged["partial"] = True
+    return merged
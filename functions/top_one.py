@@ -1,6 +1,7 @@
-from functools import lru_cache
-
-from claude import Claude
+from claude import AsyncClaude, Claude
+from shared_state import shared_cache
+from tracing import traced
+from xml_parser import parse_tags
 
 
 def top_one(retrieval_arxiv_output, user_query):
@@ -9,11 +10,14 @@ def top_one(retrieval_arxiv_output, user_query):
     return top_one_(papers_str, user_query)
 
 
-@lru_cache(maxsize=1000)
-def top_one_(paper_list_string, user_query):
-    top_one = Claude()
-    topPaper = top_one(
-        f"""I have a set of papers. I also have a query string from a user trying to figure out which paper is most relevant for them. The papers are in the following format:
+async def top_one_async(retrieval_arxiv_output, user_query):
+    papers = [dict(paper) for paper in retrieval_arxiv_output.papers]
+    papers_str = str(papers)
+    return await top_one_async_(papers_str, user_query)
+
+
+def _top_one_prompt(paper_list_string, user_query):
+    return f"""I have a set of papers. I also have a query string from a user trying to figure out which paper is most relevant for them. The papers are in the following format:
 
     {{
 
@@ -47,38 +51,31 @@ def top_one_(paper_list_string, user_query):
         <publishdate> (PUBLISH DATE OF THE SELECTED PAPER) </publishdate>
     </response>
     """
-    )
-    # print(topPaper)
-    # response = topPaper.split("<response>")[1].split("</response>")[0].replace("'", "\"")
-    # print(response)
-
-    try:
-        title = topPaper.split("<title>")[1].split("</title>")[0].replace("'", '"')
-    except:
-        title = "Nothing"
-    try:
-        summary = (
-            topPaper.split("<summary>")[1].split("</summary>")[0].replace("'", '"')
-        )
-    except:
-        summary = "Nothing"
-    try:
-        url = topPaper.split("<url>")[1].split("</url>")[0].replace("'", '"')
-    except:
+
+
+@traced("top_one_", cache=shared_cache("top_one_", maxsize=1000))
+def top_one_(paper_list_string, user_query):
+    top_one = Claude()
+    topPaper = top_one(_top_one_prompt(paper_list_string, user_query))
+    return _parse_top_paper(topPaper)
+
+
+@traced("top_one_", cache=shared_cache("top_one_", maxsize=1000))
+async def top_one_async_(paper_list_string, user_query):
+    top_one = AsyncClaude()
+    topPaper = await top_one(_top_one_prompt(paper_list_string, user_query))
+    return _parse_top_paper(topPaper)
+
+
+def _parse_top_paper(topPaper):
+    response = parse_tags(topPaper)
+    url = response.findtext("url")
+    if not url:
         raise ValueError("Top paper could not be parsed")
-        # url="https://arxiv.org/pdf/2307.04355.pdf"
-    try:
-        date = (
-            topPaper.split("<publishdate>")[1]
-            .split("</pulishdate>")[0]
-            .replace("'", '"')
-        )
-    except:
-        date = "1900-02-23"
     objectToBuild = {
-        "title": title,
-        "summary": summary,
-        "url": url,
-        "publishDate": date,
+        "title": response.findtext("title", "Nothing").replace("'", '"'),
+        "summary": response.findtext("summary", "Nothing").replace("'", '"'),
+        "url": url.replace("'", '"'),
+        "publishDate": response.findtext("publishdate", "1900-02-23").replace("'", '"'),
     }
     return objectToBuild
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from shared_state import get_shared_state
+
+GRAPH_CACHE_MAX_ENTRIES = int(os.environ.get("GRAPH_CACHE_MAX_ENTRIES", 1000))
+# Seconds a hydrated graph is served without re-reading Firestore. Without a
+# shared state versions only track this process's writes, so this bounds how
+# stale a graph that another worker extended can get
+GRAPH_CACHE_TTL = float(os.environ.get("GRAPH_CACHE_TTL", 60))
+
+
+class GraphCache:
+    # Serialized /graph responses per query, stamped with the query's graph
+    # version; every write to the query's graph document bumps the version,
+    # which lives in the shared state when one is configured
+    def __init__(
+        self,
+        max_entries: int = GRAPH_CACHE_MAX_ENTRIES,
+        ttl: float = GRAPH_CACHE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.versions = {}
+        # query -> (version, stored_at, body)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, query: str) -> int:
+        state = get_shared_state()
+        if state is not None:
+            return int(state.get(f"graph_version:{query}") or 0)
+        with self.lock:
+            return self.versions.get(query, 0)
+
+    def bump(self, query: str):
+        state = get_shared_state()
+        if state is not None:
+            state.incr(f"graph_version:{query}")
+        with self.lock:
+            self.versions[query] = self.versions.get(query, 0) + 1
+            self.entries.pop(query, None)
+
+    def get(self, query: str) -> Optional[bytes]:
+        version = self.version(query)
+        with self.lock:
+            entry = self.entries.get(query)
+            if (
+                entry is None
+                or entry[0] != version
+                or time.monotonic() - entry[1] > self.ttl
+            ):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(query)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, query: str, version: int, body: bytes):
+        # version is the one read before loading the graph; if a write landed
+        # in the meantime the graph may predate it and is not cached
+        if version != self.version(query):
+            return
+        with self.lock:
+            self.entries[query] = (version, time.monotonic(), body)
+            self.entries.move_to_end(query)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "graphs": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,128 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from functions.insight_extraction import INSIGHTS_PROMPT_VERSION
+
+INSIGHT_STORE_PATH = os.environ.get("INSIGHT_STORE_PATH", "insights.sqlite3")
+INSIGHT_STORE_MAX_ENTRIES = int(os.environ.get("INSIGHT_STORE_MAX_ENTRIES", 50_000))
+
+
+def text_hash(paper_text: str) -> str:
+    return hashlib.sha256(paper_text.encode("utf-8")).hexdigest()
+
+
+class InsightStore:
+    def __init__(
+        self,
+        path: str = INSIGHT_STORE_PATH,
+        max_entries: int = INSIGHT_STORE_MAX_ENTRIES,
+        prompt_version: str = INSIGHTS_PROMPT_VERSION,
+    ):
+        self.max_entries = max_entries
+        self.prompt_version = prompt_version
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS insights (
+                text_sha256 TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                insights TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (text_sha256, prompt_version)
+            )"""
+        )
+        self._db.commit()
+
+    def get(self, paper_text: str) -> Optional[dict]:
+        key = (text_hash(paper_text), self.prompt_version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT insights FROM insights WHERE text_sha256 = ? AND prompt_version = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE insights SET accessed_at = ? WHERE text_sha256 = ? AND prompt_version = ?",
+                (time.time(),) + key,
+            )
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, paper_text: str, insights: dict):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO insights VALUES (?, ?, ?, ?, ?)",
+                (text_hash(paper_text), self.prompt_version, json.dumps(insights), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Least recently used rows beyond max_entries
+        self._db.execute(
+            """DELETE FROM insights WHERE rowid IN (
+                SELECT rowid FROM insights ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+
+    def invalidate(self, all_versions: bool = False) -> int:
+        # Drops entries from other prompt versions, or everything
+        with self._lock:
+            if all_versions:
+                cursor = self._db.execute("DELETE FROM insights")
+            else:
+                cursor = self._db.execute(
+                    "DELETE FROM insights WHERE prompt_version != ?",
+                    (self.prompt_version,),
+                )
+            self._db.commit()
+        return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM insights").fetchone()
+        return count
+
+
+_insight_store = None
+_insight_store_lock = threading.Lock()
+
+
+def get_insight_store() -> InsightStore:
+    # Created once even when several threads ask for it first at the same time
+    global _insight_store
+    if _insight_store is None:
+        with _insight_store_lock:
+            if _insight_store is None:
+                _insight_store = InsightStore()
+    return _insight_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the persistent insight store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    invalidate = subparsers.add_parser(
+        "invalidate", help="drop insights produced by other prompt versions"
+    )
+    invalidate.add_argument(
+        "--all", action="store_true", help="drop every stored insight"
+    )
+    subparsers.add_parser("stats", help="print entry count and prompt version")
+    args = parser.parse_args()
+
+    store = get_insight_store()
+    if args.command == "invalidate":
+        removed = store.invalidate(all_versions=args.all)
+        print(f"Removed {removed} stored insights")
+    else:
+        print(f"{len(store)} stored insights, prompt version {store.prompt_version}")
@@ -0,0 +1,274 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+QUERY_JOB_WORKERS = int(os.environ.get("QUERY_JOB_WORKERS", 2))
+# SQLite file for job state; unset keeps jobs in memory only
+QUERY_JOB_STORE = os.environ.get("QUERY_JOB_STORE", "")
+# Seconds a worker's claim on its unfinished jobs lasts without renewal; jobs
+# of a worker that stopped renewing are taken over by the others
+QUERY_JOB_LEASE = float(os.environ.get("QUERY_JOB_LEASE", 60))
+# Seconds finished jobs are kept for polling before they are deleted
+QUERY_JOB_RETENTION = float(os.environ.get("QUERY_JOB_RETENTION", 24 * 60 * 60))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class InMemoryJobBackend:
+    def __init__(self):
+        # id -> (job, owner, lease_until)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def save(self, job: dict, owner: str, lease_until: float) -> bool:
+        # False when another worker has taken the job over
+        with self.lock:
+            current = self.jobs.get(job["id"])
+            if current is not None and current[1] != owner:
+                return False
+            self.jobs[job["id"]] = (json.loads(json.dumps(job)), owner, lease_until)
+            return True
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.jobs.get(job_id)
+            return None if entry is None else json.loads(json.dumps(entry[0]))
+
+    def claim(self, owner: str, lease_until: float, now: float) -> list:
+        # Unfinished jobs whose lease ran out, now owned by owner
+        with self.lock:
+            claimed = []
+            for job_id, (job, _, expires) in self.jobs.items():
+                if job["status"] in (QUEUED, RUNNING) and expires < now:
+                    self.jobs[job_id] = (job, owner, lease_until)
+                    claimed.append(json.loads(json.dumps(job)))
+            return claimed
+
+    def renew(self, owner: str, lease_until: float):
+        with self.lock:
+            for job_id, (job, job_owner, _) in self.jobs.items():
+                if job_owner == owner and job["status"] in (QUEUED, RUNNING):
+                    self.jobs[job_id] = (job, owner, lease_until)
+
+    def expire(self, finished_before: float) -> int:
+        with self.lock:
+            expired = [
+                job_id
+                for job_id, (job, _, _) in self.jobs.items()
+                if job["status"] in (DONE, FAILED) and job["updatedAt"] < finished_before
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+            return len(expired)
+
+
+class SqliteJobBackend:
+    # Shared by every worker pointed at the same file; each job row carries
+    # the worker that owns it and until when
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL
+            )"""
+        )
+        # Stores created before leases get the columns added in place
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL"), ("updated_at", "REAL")):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self.db.execute(
+            "UPDATE jobs SET updated_at = json_extract(data, '$.updatedAt') WHERE updated_at IS NULL"
+        )
+        self.db.commit()
+
+    def save(self, job: dict, owner: str, lease_until: float) -> bool:
+        with self.lock:
+            cursor = self.db.execute(
+                """INSERT INTO jobs (id, status, data, owner, lease_until, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    status = excluded.status,
+                    data = excluded.data,
+                    lease_until = excluded.lease_until,
+                    updated_at = excluded.updated_at
+                WHERE jobs.owner IS excluded.owner""",
+                (job["id"], job["status"], json.dumps(job), owner, lease_until, job["updatedAt"]),
+            )
+            self.db.commit()
+        return cursor.rowcount > 0
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def claim(self, owner: str, lease_until: float, now: float) -> list:
+        # One statement, so two workers never claim the same job
+        with self.lock:
+            rows = self.db.execute(
+                """UPDATE jobs SET owner = ?, lease_until = ?
+                WHERE status IN (?, ?) AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?)
+                RETURNING data""",
+                (owner, lease_until, QUEUED, RUNNING, now),
+            ).fetchall()
+            self.db.commit()
+        return [json.loads(data) for (data,) in rows]
+
+    def renew(self, owner: str, lease_until: float):
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (lease_until, owner, QUEUED, RUNNING),
+            )
+            self.db.commit()
+
+    def expire(self, finished_before: float) -> int:
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, finished_before),
+            )
+            self.db.commit()
+        return cursor.rowcount
+
+
+def partial_graph(nodes: list) -> Optional[dict]:
+    # Nodes arrive flat with parent ids; nest them under the root ("-1")
+    by_id = {node["id"]: dict(node, children=[]) for node in nodes}
+    for node in by_id.values():
+        parent = by_id.get(node["parent"])
+        if parent is not None:
+            parent["children"].append(node)
+    return by_id.get("-1")
+
+
+class JobQueue:
+    def __init__(
+        self,
+        run: Callable[[str], Iterable[dict]],
+        backend=None,
+        workers: int = QUERY_JOB_WORKERS,
+        lease: float = QUERY_JOB_LEASE,
+        retention: float = QUERY_JOB_RETENTION,
+    ):
+        # run(query) yields the /query pipeline events
+        self.run = run
+        self.backend = backend or InMemoryJobBackend()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lease = lease
+        self.retention = retention
+        self.owner = str(uuid.uuid4())
+        self.stopped = threading.Event()
+        self.heartbeat = None
+        self.heartbeat_lock = threading.Lock()
+
+    def submit(self, query: str) -> dict:
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "query": query,
+            "status": QUEUED,
+            "stage": None,
+            "nodesDone": 0,
+            "nodes": [],
+            "graph": None,
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        self.backend.save(job, self.owner, now + self.lease)
+        self._start_heartbeat()
+        # The worker mutates its own copy as events arrive
+        self.executor.submit(self._run_job, dict(job, nodes=[]))
+        return job
+
+    def resume(self) -> int:
+        # Jobs whose worker stopped renewing its lease (a restart, a crash)
+        # start over from the beginning; those of live workers are left alone
+        self._start_heartbeat()
+        return self._claim()
+
+    def _claim(self) -> int:
+        now = time.time()
+        jobs = self.backend.claim(self.owner, now + self.lease, now)
+        for job in jobs:
+            job.update(status=QUEUED, stage=None, nodesDone=0, nodes=[], graph=None)
+            if self._save(job):
+                self.executor.submit(self._run_job, job)
+        return len(jobs)
+
+    def _start_heartbeat(self):
+        with self.heartbeat_lock:
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(target=self._beat, daemon=True)
+                self.heartbeat.start()
+
+    def _beat(self):
+        # Renews this worker's leases, takes over expired ones and deletes
+        # finished jobs past their retention
+        while not self.stopped.wait(self.lease / 3):
+            try:
+                self.backend.renew(self.owner, time.time() + self.lease)
+                resumed = self._claim()
+                if resumed:
+                    print(f"Took over {resumed} query jobs")
+                self.backend.expire(time.time() - self.retention)
+            except Exception as e:
+                print(f"Query job heartbeat failed: {e}")
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.backend.load(job_id)
+
+    def _run_job(self, job: dict):
+        job["status"] = RUNNING
+        if not self._save(job):
+            return
+        try:
+            for event in self.run(job["query"]):
+                if event["event"] == "stage":
+                    job["stage"] = event["stage"]
+                elif event["event"] == "node":
+                    job["nodes"].append(event["node"])
+                    job["nodesDone"] = len(job["nodes"])
+                elif event["event"] == "graph":
+                    job["graph"] = event["graph"]
+                if not self._save(job):
+                    print(f"Query job {job['id']} was taken over by another worker")
+                    return
+            job["status"] = DONE
+        except Exception as e:
+            print(f"Query job {job['id']} failed: {e}")
+            job["status"] = FAILED
+            job["error"] = str(e)
+        self._save(job)
+
+    def _save(self, job: dict) -> bool:
+        job["updatedAt"] = time.time()
+        # Once shut down, jobs still finishing here don't renew their lease
+        lease_until = 0 if self.stopped.is_set() else job["updatedAt"] + self.lease
+        return self.backend.save(job, self.owner, lease_until)
+
+    def shutdown(self):
+        # Unfinished jobs are released so the next worker to start resumes
+        # them right away
+        self.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.backend.renew(self.owner, 0)
+
+
+def make_job_backend(path: str = QUERY_JOB_STORE):
+    return SqliteJobBackend(path) if path else InMemoryJobBackend()
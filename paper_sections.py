@@ -0,0 +1,48 @@
+import re
+from typing import List, Optional, Tuple
+
+# Heading lines as PyPDF2 renders them: "3 Model Architecture", "2.1. Attention",
+# "ABSTRACT", "References", "Appendix A ..."
+SECTION_HEADING = re.compile(
+    r"^[ \t]*(?:"
+    r"\d{1,2}(?:\.\d{1,2})*\.?[ \t]+[A-Z][^\n]{2,80}"
+    r"|[A-Z][A-Z \t\-]{3,60}"
+    r"|(?:Abstract|Introduction|Conclusions?|Acknowledge?ments?|References(?:[ \t]+and[ \t]+Notes)?|Bibliography)"
+    r"|(?:Appendix|Supplementary)[^\n]{0,80}"
+    r")[ \t]*$",
+    re.MULTILINE,
+)
+REFERENCES_HEADING = re.compile(
+    r"(?:^|\s)(?:References(?:\s+and\s+Notes)?|REFERENCES|Bibliography|BIBLIOGRAPHY)\s*(?:\n|$)",
+)
+APPENDIX_HEADING = re.compile(r"^[ \t]*(?:Appendix|APPENDIX|Supplementary)", re.MULTILINE)
+
+
+def split_sections(paper_text: str) -> List[Tuple[str, str]]:
+    # (heading, text) pairs covering the whole paper; text includes the heading
+    starts = [match.start() for match in SECTION_HEADING.finditer(paper_text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(paper_text))
+    sections = []
+    for start, end in zip(starts, starts[1:]):
+        text = paper_text[start:end]
+        if text.strip():
+            sections.append((text.strip().split("\n", 1)[0].strip(), text))
+    return sections
+
+
+def find_references_section(paper_text: str) -> Optional[Tuple[int, int]]:
+    # Span of the reference list: from the last "References" heading to the
+    # first appendix heading after it (or the end of the paper)
+    matches = list(REFERENCES_HEADING.finditer(paper_text))
+    if not matches:
+        return None
+    start = matches[-1].end()
+    appendix = APPENDIX_HEADING.search(paper_text, start)
+    end = appendix.start() if appendix else len(paper_text)
+    return start, end
+
+
+def is_appendix(heading: str) -> bool:
+    return APPENDIX_HEADING.match(heading) is not None
@@ -0,0 +1,98 @@
+import os
+import re
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+from paper_sections import find_references_section
+
+# Passages are overlapping windows of this many words, half a window apart
+PASSAGE_WORDS = int(os.environ.get("PASSAGE_WORDS", 150))
+# Passages sent to Claude when expanding a concept description
+PASSAGE_TOP_K = int(os.environ.get("PASSAGE_TOP_K", 6))
+
+TERM = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+class PassageIndex:
+    # BM25 over the passages of one paper. Postings are flat arrays sorted by
+    # term with each passage's precomputed BM25 weight, so scoring a query is
+    # one bincount over the postings of its terms
+    def __init__(self, paper_text: str, passage_words: int = PASSAGE_WORDS):
+        references = find_references_section(paper_text)
+        if references is not None:
+            paper_text = paper_text[: references[0]]
+        self.words = paper_text.split()
+        stride = max(1, passage_words // 2)
+        self.spans = [
+            (start, min(start + passage_words, len(self.words)))
+            for start in range(0, max(1, len(self.words) - stride), stride)
+        ]
+
+        self.vocabulary = {}
+        term_ids = []
+        passage_ids = []
+        for passage, (start, end) in enumerate(self.spans):
+            terms = TERM.findall(" ".join(self.words[start:end]).lower())
+            term_ids.extend(self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms)
+            passage_ids.extend([passage] * len(terms))
+        term_ids = np.array(term_ids, dtype=np.int64)
+        passage_ids = np.array(passage_ids, dtype=np.int64)
+
+        passages = len(self.spans)
+        lengths = np.bincount(passage_ids, minlength=passages).astype(np.float32)
+        # Unique (term, passage) pairs sorted by term, with their counts
+        pairs, tf = np.unique(term_ids * passages + passage_ids, return_counts=True)
+        posting_terms = pairs // passages
+        self.posting_passages = pairs % passages
+        document_frequency = np.bincount(posting_terms, minlength=len(self.vocabulary))
+        idf = np.log1p((passages - document_frequency + 0.5) / (document_frequency + 0.5))
+        length_norm = 1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0)
+        self.posting_weights = (
+            idf[posting_terms]
+            * tf
+            * (BM25_K1 + 1)
+            / (tf + BM25_K1 * length_norm[self.posting_passages])
+        ).astype(np.float32)
+        self.term_offsets = np.searchsorted(posting_terms, np.arange(len(self.vocabulary) + 1))
+
+    def scores(self, query: str) -> np.ndarray:
+        term_ids = {self.vocabulary[term] for term in TERM.findall(query.lower()) if term in self.vocabulary}
+        if not term_ids:
+            return np.zeros(len(self.spans), dtype=np.float32)
+        postings = np.concatenate(
+            [np.arange(self.term_offsets[term], self.term_offsets[term + 1]) for term in term_ids]
+        )
+        return np.bincount(
+            self.posting_passages[postings],
+            weights=self.posting_weights[postings],
+            minlength=len(self.spans),
+        )
+
+    def top_passages(self, query: str, k: int = PASSAGE_TOP_K) -> List[str]:
+        # The best k windows in paper order, overlapping ones merged
+        scores = self.scores(query)
+        best = np.argsort(-scores, kind="stable")[:k]
+        merged = []
+        for start, end in sorted(self.spans[i] for i in best):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [" ".join(self.words[start:end]) for start, end in merged]
+
+
+@lru_cache(maxsize=64)
+def passage_index(paper_text: str) -> PassageIndex:
+    return PassageIndex(paper_text)
+
+
+def relevant_passages(paper_text: str, query: str, k: int = PASSAGE_TOP_K) -> str:
+    # Papers that fit in k passages are returned whole
+    index = passage_index(paper_text)
+    if len(index.spans) <= k:
+        return paper_text
+    return "\n...\n".join(index.top_passages(query, k))
@@ -0,0 +1,285 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cassette import CassetteAdapter, get_cassette
+from tracing import annotate
+
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", ".pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 2 * 1024**3))
+# Cached copies younger than this are served without a conditional GET
+PDF_CACHE_REVALIDATE_AFTER = int(os.environ.get("PDF_CACHE_REVALIDATE_AFTER", 24 * 3600))
+# Seconds to connect and between received bytes; larger downloads are abandoned
+PDF_DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get("PDF_DOWNLOAD_CONNECT_TIMEOUT", 10))
+PDF_DOWNLOAD_READ_TIMEOUT = float(os.environ.get("PDF_DOWNLOAD_READ_TIMEOUT", 60))
+PDF_DOWNLOAD_MAX_BYTES = int(os.environ.get("PDF_DOWNLOAD_MAX_BYTES", 100 * 1024**2))
+# Keep-alive connections kept per host
+PDF_DOWNLOAD_POOL_SIZE = int(os.environ.get("PDF_DOWNLOAD_POOL_SIZE", 16))
+PDF_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class PdfTooLarge(Exception):
+    pass
+
+
+def canonical_url(url: str) -> str:
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+    netloc = netloc.lower()
+    if scheme.lower() in ("http", "https"):
+        scheme = "https"
+    if netloc in ("arxiv.org", "www.arxiv.org", "export.arxiv.org"):
+        # abs/, pdf/ and pdf/<id>.pdf all name the same arXiv PDF
+        netloc = "arxiv.org"
+        if path.startswith("/abs/"):
+            path = "/pdf/" + path[len("/abs/"):]
+        if path.endswith(".pdf"):
+            path = path[: -len(".pdf")]
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class PdfCache:
+    def __init__(
+        self,
+        directory: str = PDF_CACHE_DIR,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+        revalidate_after: int = PDF_CACHE_REVALIDATE_AFTER,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        if get_cassette() is not None:
+            adapter = CassetteAdapter(get_cassette(), pool_maxsize=PDF_DOWNLOAD_POOL_SIZE)
+        else:
+            adapter = HTTPAdapter(pool_maxsize=PDF_DOWNLOAD_POOL_SIZE)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"), check_same_thread=False
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                validated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256 + ".pdf")
+
+    def get(self, url: str) -> Optional[str]:
+        key = canonical_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, etag, last_modified, validated_at FROM entries WHERE url = ?",
+                (key,),
+            ).fetchone()
+        if row is not None and not os.path.exists(self.blob_path(row[0])):
+            row = None
+
+        if row is not None and time.time() - row[3] < self.revalidate_after:
+            self._touch(key, validated=False)
+            self._count_hit()
+            return self.blob_path(row[0])
+
+        headers = {}
+        if row is not None:
+            if row[1]:
+                headers["If-None-Match"] = row[1]
+            if row[2]:
+                headers["If-Modified-Since"] = row[2]
+
+        try:
+            response = self._session.get(
+                url,
+                headers=headers,
+                stream=True,
+                timeout=(PDF_DOWNLOAD_CONNECT_TIMEOUT, PDF_DOWNLOAD_READ_TIMEOUT),
+            )
+        except requests.RequestException as e:
+            if row is None:
+                raise
+            # Serve the stale copy rather than failing the request
+            print(f"Revalidation of {url} failed, serving cached copy: {e}")
+            self._count_hit()
+            return self.blob_path(row[0])
+
+        if row is not None and response.status_code == 304:
+            response.close()
+            self._touch(key, validated=True)
+            self._count_hit(revalidated=True)
+            return self.blob_path(row[0])
+
+        if response.status_code != 200:
+            response.close()
+            if row is not None:
+                print(f"Revalidation of {url} returned {response.status_code}, serving cached copy")
+                self._count_hit()
+                return self.blob_path(row[0])
+            print("Failed to download the file.")
+            return None
+
+        with self._lock:
+            self.misses += 1
+        annotate(cache_hit=False)
+        with response:
+            return self.put_stream(url, response)
+
+    def _count_hit(self, revalidated: bool = False):
+        with self._lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+        annotate(cache_hit=True)
+
+    def put(
+        self,
+        url: str,
+        content: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> str:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        return self._store(
+            url, tmp_path, hashlib.sha256(content).hexdigest(), len(content), etag, last_modified
+        )
+
+    def put_stream(self, url: str, response: requests.Response) -> str:
+        # Written to disk chunk by chunk, never holding the whole PDF in memory
+        size = int(response.headers.get("Content-Length") or 0)
+        if size > PDF_DOWNLOAD_MAX_BYTES:
+            raise PdfTooLarge(f"{url} is {size} bytes, over {PDF_DOWNLOAD_MAX_BYTES}")
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in response.iter_content(PDF_DOWNLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > PDF_DOWNLOAD_MAX_BYTES:
+                        raise PdfTooLarge(f"{url} is over {PDF_DOWNLOAD_MAX_BYTES} bytes")
+                    digest.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self._store(
+            url,
+            tmp_path,
+            digest.hexdigest(),
+            size,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+
+    def _store(
+        self,
+        url: str,
+        tmp_path: str,
+        sha256: str,
+        size: int,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ) -> str:
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (canonical_url(url), sha256, size, etag, last_modified, now, now),
+            )
+            self._db.commit()
+        self.evict(keep=sha256)
+        return path
+
+    def _touch(self, key: str, validated: bool):
+        now = time.time()
+        with self._lock:
+            if validated:
+                self._db.execute(
+                    "UPDATE entries SET accessed_at = ?, validated_at = ? WHERE url = ?",
+                    (now, now, key),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE url = ?", (now, key)
+                )
+            self._db.commit()
+
+    def size_bytes(self) -> int:
+        # Blobs are shared between URLs with identical content, count them once
+        with self._lock:
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)"
+            ).fetchone()
+        return total
+
+    def evict(self, keep: Optional[str] = None):
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT sha256, MAX(size), MAX(accessed_at) AS last_access
+                FROM entries GROUP BY sha256 ORDER BY last_access ASC"""
+            ).fetchall()
+            total = sum(size for _, size, _ in rows)
+            for sha256, size, _ in rows:
+                if total <= self.max_bytes:
+                    break
+                if sha256 == keep:
+                    continue
+                self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+                try:
+                    os.remove(self.blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "bytes": self.size_bytes(),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> PdfCache:
+    # Created once even when several threads ask for it first at the same time
+    global _pdf_cache
+    if _pdf_cache is None:
+        with _pdf_cache_lock:
+            if _pdf_cache is None:
+                _pdf_cache = PdfCache()
+    return _pdf_cache
@@ -1,46 +1,111 @@
+import mmap
+import multiprocessing
 import os
-import requests
-import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from functools import lru_cache
 
 from PyPDF2 import PdfReader
 
+from pdf_cache import get_pdf_cache
+from shared_state import shared_cache
+from tracing import traced
 
-@lru_cache(maxsize=1000)
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Documents shorter than this are extracted serially, a pool round trip costs more
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 8))
+
+_extract_pool = None
+_extract_pool_workers = 0
+_extract_pool_lock = threading.Lock()
+
+
+@shared_cache("pdf_url_to_text", maxsize=1000)
 def pdf_url_to_text(url: str) -> str:
     tempfile = download_pdf(url)
     text = pdf_to_text(tempfile)
     return text
 
 
-@lru_cache(maxsize=1000)
-def pdf_to_text(path_to_pdf: str) -> str:
-    reader = PdfReader(path_to_pdf)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+@traced("pdf_to_text", cache=lru_cache(maxsize=1000))
+def pdf_to_text(path_to_pdf: str, workers: int = PDF_EXTRACT_WORKERS) -> str:
+    with open_pdf(path_to_pdf) as reader:
+        num_pages = len(reader.pages)
+        if workers <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+            return "".join(page.extract_text() for page in reader.pages)
 
+    # Contiguous page ranges, one per worker, joined once in page order
+    workers = min(workers, num_pages)
+    bounds = [num_pages * i // workers for i in range(workers + 1)]
+    with _extract_pool_lock:
+        pool = get_extract_pool(workers)
+        try:
+            chunks = [
+                pool.submit(extract_page_range, path_to_pdf, start, stop)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+        except BrokenProcessPool:
+            chunks = None
+    try:
+        if chunks is not None:
+            return "".join(chunk.result() for chunk in chunks)
+    except BrokenProcessPool:
+        pass
+    # A worker died (out of memory, a crash on a bad page): later documents
+    # get a new pool, this one is extracted here
+    print(f"PDF extraction pool broke on {path_to_pdf}, extracting serially")
+    discard_extract_pool(pool)
+    return extract_page_range(path_to_pdf, 0, num_pages)
 
-@lru_cache(maxsize=30)
-def download_pdf(url):
-    # Send a GET request to the URL
-    response = requests.get(url)
 
-    # Check if the request was successful
-    if response.status_code != 200:
-        print("Failed to download the file.")
-        return None
+def extract_page_range(path_to_pdf: str, start: int, stop: int) -> str:
+    with open_pdf(path_to_pdf) as reader:
+        return "".join(reader.pages[i].extract_text() for i in range(start, stop))
 
-    # Create a temporary directory
-    temp_dir = tempfile.mkdtemp()
 
-    # Determine the file name from the URL
-    filename = os.path.join(temp_dir, url.split("/")[-1])
+@contextmanager
+def open_pdf(path_to_pdf: str):
+    # PdfReader(path) reads the whole file into a BytesIO; over a read-only
+    # map the extraction processes share the page cache instead of each
+    # holding a copy
+    with open(path_to_pdf, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        yield PdfReader(buffer)
 
-    # Write the content to a PDF file
-    with open(filename, "wb") as file:
-        file.write(response.content)
 
-    print(f"Downloaded file saved in {filename}")
+def get_extract_pool(workers: int) -> ProcessPoolExecutor:
+    # Call with _extract_pool_lock held and submit before releasing it: a
+    # pool outgrown by a larger request is retired once its queued work is
+    # done, and takes no new work. Workers are started by a fork server
+    # rather than forked from a process with live threads
+    global _extract_pool, _extract_pool_workers
+    if _extract_pool is None or _extract_pool_workers < workers:
+        if _extract_pool is not None:
+            threading.Thread(target=_extract_pool.shutdown, daemon=True).start()
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _extract_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(method)
+        )
+        _extract_pool_workers = workers
+    return _extract_pool
+
+
+def discard_extract_pool(pool: ProcessPoolExecutor):
+    global _extract_pool, _extract_pool_workers
+    with _extract_pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+            _extract_pool_workers = 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@traced("download_pdf")
+def download_pdf(url):
+    # Served from the persistent PDF cache, downloading (or revalidating) as needed
+    filename = get_pdf_cache().get(url)
+    if filename is not None:
+        print(f"PDF for {url} available at {filename}")
     return filename
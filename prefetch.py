@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from tracing import span
+
+# Background threads warming the caches for the papers behind a returned
+# graph's leaves; 0 disables prefetching
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 2))
+# Queued papers beyond this are dropped, lowest priority first
+PREFETCH_MAX_QUEUED = int(os.environ.get("PREFETCH_MAX_QUEUED", 64))
+# Papers prefetched per hour across all graphs
+PREFETCH_BUDGET_PER_HOUR = int(os.environ.get("PREFETCH_BUDGET_PER_HOUR", 200))
+# Also extract insights, not just the text (costs a Claude call per paper)
+PREFETCH_INSIGHTS = os.environ.get("PREFETCH_INSIGHTS", "0") == "1"
+
+# Recently prefetched URLs that are not queued again
+_RECENT_URLS = 10_000
+
+
+def leaf_urls(graph: dict) -> list:
+    # (depth, url) of the leaves in breadth-first order, the order users
+    # tend to open them in. Leaves citing their parent's own paper are
+    # already warm
+    leaves = []
+    level = [(graph, None)]
+    depth = 0
+    while level:
+        next_level = []
+        for node, parent_url in level:
+            url = node.get("referenceUrl")
+            if node["children"]:
+                next_level.extend((child, url) for child in node["children"])
+            elif url and url != parent_url:
+                leaves.append((depth, url))
+        level = next_level
+        depth += 1
+    return leaves
+
+
+class Prefetcher:
+    # Priority queue of paper URLs: newer graphs first, then shallower and
+    # earlier leaves. fetch(url) does the actual warming, on worker threads
+    # that start() launches
+    def __init__(
+        self,
+        fetch: Callable[[str], None],
+        workers: int = PREFETCH_WORKERS,
+        max_queued: int = PREFETCH_MAX_QUEUED,
+        budget_per_hour: int = PREFETCH_BUDGET_PER_HOUR,
+    ):
+        self.fetch = fetch
+        self.workers = workers
+        self.max_queued = max_queued
+        self.budget_per_hour = budget_per_hour
+        self.budget = float(budget_per_hour)
+        self.budget_updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.queue = []
+        self.queued = {}
+        self.recent = OrderedDict()
+        self.graphs = itertools.count()
+        self.sequence = itertools.count()
+        self.stopped = False
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.over_budget = 0
+        self.threads = []
+
+    def start(self):
+        with self.condition:
+            if self.threads or self.stopped:
+                return
+            self.threads = [
+                threading.Thread(target=self._run, daemon=True) for _ in range(self.workers)
+            ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit_graph(self, graph: dict):
+        # Graphs submitted before start() are prefetched once it runs
+        if not self.workers:
+            return
+        generation = next(self.graphs)
+        with self.condition:
+            for depth, url in leaf_urls(graph):
+                if url in self.recent:
+                    continue
+                entry = [(-generation, depth, next(self.sequence)), url, False]
+                previous = self.queued.get(url)
+                if previous is not None:
+                    if previous[0] <= entry[0]:
+                        continue
+                    # Re-queued at the higher priority
+                    previous[2] = True
+                self.queued[url] = entry
+                heapq.heappush(self.queue, entry)
+            self._drop_excess()
+            self.condition.notify_all()
+
+    def _drop_excess(self):
+        live = [entry for entry in self.queue if not entry[2]]
+        if len(live) <= self.max_queued:
+            return
+        live.sort()
+        for entry in live[self.max_queued :]:
+            entry[2] = True
+            del self.queued[entry[1]]
+            self.dropped += 1
+        self.queue = live[: self.max_queued]
+        heapq.heapify(self.queue)
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        self.budget = min(
+            self.budget_per_hour,
+            self.budget + (now - self.budget_updated) * self.budget_per_hour / 3600,
+        )
+        self.budget_updated = now
+        if self.budget < 1:
+            return False
+        self.budget -= 1
+        return True
+
+    def _next(self):
+        with self.condition:
+            while True:
+                while self.queue and self.queue[0][2]:
+                    heapq.heappop(self.queue)
+                if self.stopped:
+                    return None
+                if self.queue:
+                    entry = heapq.heappop(self.queue)
+                    del self.queued[entry[1]]
+                    if not self._take_budget():
+                        self.over_budget += 1
+                        continue
+                    self.recent[entry[1]] = True
+                    if len(self.recent) > _RECENT_URLS:
+                        self.recent.popitem(last=False)
+                    self.started += 1
+                    return entry[1]
+                self.condition.wait()
+
+    def _run(self):
+        while True:
+            url = self._next()
+            if url is None:
+                return
+            try:
+                with span("prefetch"):
+                    self.fetch(url)
+                with self.condition:
+                    self.completed += 1
+            except Exception as e:
+                print(f"Prefetching {url} failed: {e}")
+                with self.condition:
+                    self.failed += 1
+
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "queued": len(self.queued),
+                "started": self.started,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "overBudget": self.over_budget,
+                "budget": int(self.budget),
+            }
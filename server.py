@@ -1,17 +1,29 @@
+import copy
 import json
-import time
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Optional
 import uuid
 from functools import lru_cache
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import arxiv_script
-from functions.top_one import top_one
-from functions.expand_description_to_text import expand, expand_without_paper
+from functions.top_one import top_one, top_one_async
+from functions.expand_description_to_text import expand_async, expand_without_paper_async
 from pdf_parser import pdf_url_to_text
-from functions.insight_extraction import extract_key_insights
+from pdf_cache import canonical_url, get_pdf_cache
+from single_flight import SingleFlight
+from functions.insight_extraction import extract_key_insights_streaming, is_complete
+from insight_store import get_insight_store
+from jobs import JobQueue, make_job_backend, partial_graph
 from firebase import get_firestore_client
+from concept_store import ConceptStore
+from graph_cache import GraphCache
+from prefetch import PREFETCH_INSIGHTS, Prefetcher
+from tracing import SERVER_TIMING_HEADER, propagate, render_metrics, span, start_trace
 from fastapi.middleware.cors import CORSMiddleware
 
 origins = [
@@ -19,7 +31,23 @@ origins = [
     # Add more allowed origins if needed
 ]
 
-concept_map = {}
+concept_store = ConceptStore()
+graph_cache = GraphCache()
+
+
+def invalidate_graph(collection_name: str, document_name: str):
+    # Bumped once the write has landed: with FIRESTORE_WRITE_BEHIND a bump
+    # at enqueue time would let /graph cache the document before the write
+    if collection_name == "graph":
+        graph_cache.bump(document_name)
+
+
+get_firestore_client().on_commit(invalidate_graph)
+
+insights_single_flight = SingleFlight()
+
+# Upper bound on child papers expanded concurrently by /query
+CHILD_INSIGHTS_WORKERS = int(os.environ.get("CHILD_INSIGHTS_WORKERS", 4))
 
 
 class TopPaper(BaseModel):
@@ -91,6 +119,51 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = start_trace()
+    response = await call_next(request)
+    if SERVER_TIMING_HEADER and trace.spans:
+        # Only covers the work done before the response started
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+query_jobs = JobQueue(
+    lambda query: query_graph_events(Query(query=query)), backend=make_job_backend()
+)
+
+
+def prefetch_paper(pdf_url: str):
+    # Warms what a click on the node runs: /more-info needs the text,
+    # /expand-graph-with-new-nodes the insights
+    pdf_url_to_text(pdf_url)
+    if PREFETCH_INSIGHTS:
+        generate_insights(pdf_url=pdf_url)
+
+
+prefetcher = Prefetcher(prefetch_paper)
+
+
+@app.on_event("startup")
+def start_prefetcher():
+    prefetcher.start()
+
+
+@app.on_event("startup")
+def resume_query_jobs():
+    resumed = query_jobs.resume()
+    if resumed:
+        print(f"Resumed {resumed} query jobs")
+
+
+@app.on_event("shutdown")
+def flush_firestore_writes():
+    query_jobs.shutdown()
+    prefetcher.shutdown()
+    get_firestore_client().flush()
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -99,10 +172,60 @@ def read_root():
 # public-facing endpoint
 @app.post("/query")
 def send_query(query: Query):
+    for event in query_graph_events(query):
+        if event["event"] == "graph":
+            return event["graph"]
+
+
+# Same pipeline as /query, streamed as NDJSON: the root, each first-level node
+# once the top paper's insights are in, grandchildren as each child paper
+# finishes, then the full hydrated graph
+@app.post("/query/stream")
+def send_query_stream(query: Query):
+    def ndjson():
+        for event in query_graph_events(query):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+# Job mode: returns a job id at once and runs the pipeline on a bounded pool
+@app.post("/query/jobs")
+def submit_query_job(query: Query):
+    job = query_jobs.submit(query.query)
+    return {"id": job["id"], "status": job["status"]}
+
+
+@app.get("/query/jobs/{job_id}")
+def query_job_status(job_id: str):
+    job = query_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        key: job[key]
+        for key in ("id", "query", "status", "stage", "nodesDone", "error")
+    }
+
+
+@app.get("/query/jobs/{job_id}/graph")
+def query_job_graph(job_id: str):
+    job = query_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    complete = job["graph"] is not None
+    return {
+        "status": job["status"],
+        "complete": complete,
+        "graph": job["graph"] if complete else partial_graph(job["nodes"]),
+    }
+
+
+def query_graph_events(query: Query):
     firestore_client = get_firestore_client()
     if query.query.startswith("http") and query.query.endswith(".pdf"):
         top_paper_url = query.query
     else:
+        yield {"event": "stage", "stage": "top_paper"}
         retrieve_arxiv_search(query.query)
         papers = firestore_client.read_from_document(
             collection_name="retrieval", document_name=query.query
@@ -118,54 +241,108 @@ def send_query(query: Query):
     error = 0
     result = {"-1": dict()}
 
-    concept_map["-1"] = ConceptNode(
-        name="query", referenceUrl="", description="", id="-1"
-    )
+    yield {"event": "node", "node": root_node_json(query.query)}
 
+    yield {"event": "stage", "stage": "insights"}
     try:
         insights = generate_insights(pdf_url=top_paper_url)
     except Exception as e:
         insights = []
         print(f"Something went wrong generating insights: {str(e)}")
         error += 1
+        yield {"event": "error", "message": str(e)}
     if insights:
         for child_concept in insights.concepts:
             child_concept.parent = "-1"
-            if child_concept.id not in result["-1"]:
-                # Initialize child first
-                result["-1"][child_concept.id] = {}
-            child_result = result["-1"][child_concept.id]
-            if child_concept.referenceUrl != top_paper_url:
-                try:
-                    child_insights = generate_insights(
-                        pdf_url=child_concept.referenceUrl
-                    )
-                    for grandchild_concept in child_insights.concepts:
-                        grandchild_concept.parent = child_concept.id
-                        child_concept.children.append(grandchild_concept.id)
-                        firestore_client.write_data_to_collection(
-                            collection_name="graph",
-                            document_name=query.query,
-                            data={grandchild_concept.id: dict(grandchild_concept)},
-                        )
-                        if grandchild_concept.id not in child_result:
-                            # Initialize grand child
-                            child_result[grandchild_concept.id] = {}
-                except Exception as e:
-                    error += 1
-                    print(f"Something went wrong adding children: {str(e)}")
-                    print(e)
-
-            firestore_client.write_data_to_collection(
-                collection_name="graph",
-                document_name=query.query,
-                data={child_concept.id: dict(child_concept)},
-            )
-
+            concept_store.put(child_concept)
+            yield {"event": "node", "node": node_json(child_concept)}
+
+        yield {"event": "stage", "stage": "children"}
+
+        # Fan the child expansions out, but consume them in concept order so the
+        # graph and the Firestore writes match the serial version
+        with ThreadPoolExecutor(
+            max_workers=CHILD_INSIGHTS_WORKERS
+        ) as executor, firestore_client.batch() as graph_writes:
+            child_futures = {
+                child_concept.id: executor.submit(
+                    propagate(generate_insights), pdf_url=child_concept.referenceUrl
+                )
+                for child_concept in insights.concepts
+                if child_concept.referenceUrl != top_paper_url
+            }
+            # Stream grandchildren in completion order, the graph itself is
+            # assembled in concept order below
+            parent_ids = {future: child_id for child_id, future in child_futures.items()}
+            for future in as_completed(parent_ids):
+                if future.exception() is not None:
+                    yield {"event": "error", "message": str(future.exception())}
+                    continue
+                for grandchild_concept in future.result().concepts:
+                    grandchild_concept.parent = parent_ids[future]
+                    yield {"event": "node", "node": node_json(grandchild_concept)}
+
+            for child_concept in insights.concepts:
+                if child_concept.id not in result["-1"]:
+                    # Initialize child first
+                    result["-1"][child_concept.id] = {}
+                child_result = result["-1"][child_concept.id]
+                if child_concept.id in child_futures:
+                    try:
+                        child_insights = child_futures[child_concept.id].result()
+                        for grandchild_concept in child_insights.concepts:
+                            grandchild_concept.parent = child_concept.id
+                            child_concept.children.append(grandchild_concept.id)
+                            concept_store.put(grandchild_concept)
+                            graph_writes.write_data_to_collection(
+                                collection_name="graph",
+                                document_name=query.query,
+                                data={grandchild_concept.id: dict(grandchild_concept)},
+                            )
+                            if grandchild_concept.id not in child_result:
+                                # Initialize grand child
+                                child_result[grandchild_concept.id] = {}
+                    except Exception as e:
+                        error += 1
+                        print(f"Something went wrong adding children: {str(e)}")
+                        print(e)
+
+                graph_writes.write_data_to_collection(
+                    collection_name="graph",
+                    document_name=query.query,
+                    data={child_concept.id: dict(child_concept)},
+                )
+
+    yield {"event": "stage", "stage": "hydrate"}
     hydrated_graph = hydrate_node(
         input=idGraphSchema(id="-1", query=query.query, id_map=result)
     )
-    return hydrated_graph
+    prefetcher.submit_graph(hydrated_graph)
+    yield {"event": "graph", "graph": hydrated_graph}
+
+
+def root_node_json(query: str) -> dict:
+    return {
+        "name": query,
+        "id": "-1",
+        "children": [],
+        "parent": None,
+        "description": None,
+        "referenceUrl": None,
+        "referenceText": None,
+    }
+
+
+def node_json(concept: ConceptNode) -> dict:
+    return {
+        "name": concept.name,
+        "id": concept.id,
+        "children": [],
+        "parent": concept.parent,
+        "description": concept.description,
+        "referenceUrl": concept.referenceUrl,
+        "referenceText": concept.referenceText,
+    }
 
 
 @app.get("/hydrate-node")
@@ -175,29 +352,14 @@ def hydrate_node(input: idGraphSchema):
 
         if cur_id == "-1":
             current_concept = None
-            result_map[cur_id] = {
-                "name": input.query,
-                "id": "-1",
-                "children": [],
-                "parent": None,
-                "description": None,
-                "referenceUrl": None,
-                "referenceText": None,
-            }
+            result_map[cur_id] = root_node_json(input.query)
         else:
-            current_concept = concept_map[cur_id]
-            result_map[cur_id] = {
-                "name": current_concept.name,
-                "id": cur_id,
-                "children": [],
-                "parent": current_concept.parent,
-                "description": current_concept.description,
-                "referenceUrl": current_concept.referenceUrl,
-                "referenceText": current_concept.referenceText,
-            }
+            current_concept = concept_store.get(cur_id, input.query)
+            result_map[cur_id] = node_json(current_concept)
 
-        if current_concept:
-            parent_concept = concept_map[current_concept.parent]
+        # The root is never stored, and has no paper to compare against
+        if current_concept and current_concept.parent != "-1":
+            parent_concept = concept_store.get(current_concept.parent, input.query)
             if parent_concept.referenceUrl == current_concept.referenceUrl:
                 # Don't expand children (leaf node to avoid recursion)
                 return result_map[cur_id]
@@ -214,6 +376,30 @@ def hydrate_node(input: idGraphSchema):
     return helper(input.id, input.id_map)
 
 
+def hydrate_graph(query: str, graph: dict) -> dict:
+    # graph is the query's Firestore graph document, concept id -> fields
+    nodes = [root_node_json(query)]
+    nodes += [node_json(ConceptNode.construct(**fields)) for fields in graph.values()]
+    return partial_graph(nodes)
+
+
+@app.get("/graph/{query:path}")
+def get_graph(query: str):
+    with span("graph_cache") as lookup:
+        body = graph_cache.get(query)
+        lookup.set(cache_hit=body is not None)
+    if body is None:
+        version = graph_cache.version(query)
+        graph = get_firestore_client().read_from_document(
+            collection_name="graph", document_name=query
+        )
+        if graph is None:
+            raise HTTPException(status_code=404, detail="Graph not found")
+        body = json.dumps(hydrate_graph(query, graph)).encode()
+        graph_cache.put(query, version, body)
+    return Response(content=body, media_type="application/json")
+
+
 def retrieve_arxiv_search(query: str) -> str:
     firestore_client = get_firestore_client()
     papers = arxiv_script.search_arxiv(query)
@@ -223,10 +409,19 @@ def retrieve_arxiv_search(query: str) -> str:
     return "Success"
 
 
-@app.get("/top-paper")
 def get_top_paper(input: TopPaperQuerySchema):
-    firestore_client = get_firestore_client()
     result = top_one(input.papers, input.query)
+    return save_top_paper(input.query, result)
+
+
+@app.get("/top-paper")
+async def get_top_paper_async(input: TopPaperQuerySchema):
+    result = await top_one_async(input.papers, input.query)
+    return await run_in_threadpool(save_top_paper, input.query, result)
+
+
+def save_top_paper(query: str, result: dict):
+    firestore_client = get_firestore_client()
     topPaper = {
         "url": result["url"],
         "title": result["title"],
@@ -235,24 +430,21 @@ def get_top_paper(input: TopPaperQuerySchema):
     }
     firestore_client.write_data_to_collection(
         collection_name="retrieval",
-        document_name=input.query,
+        document_name=query,
         data={"topPaper": topPaper},
     )
     return topPaper
 
 
 def generate_insights(pdf_url: str) -> PaperInsights:
-    paper_text = pdf_url_to_text(pdf_url)
-    insights = extract_key_insights(paper_text)
-
-    try:
-        with open("insight_logs.txt", "a", encoding="utf-8") as f:
-            f.write(json.dumps(insights) + "\n")
-    except:
-        pass
-
-    references = insights["references"]
-    references = {ref["bibkey"]: ref["title"] for ref in references}
+    # Callers racing on the same paper share one download and Claude call; each
+    # gets its own copy because the ideas are consumed below
+    paper = copy.deepcopy(
+        insights_single_flight.do(canonical_url(pdf_url), load_paper_insights, pdf_url)
+    )
+    insights = paper["insights"]
+    references = paper["references"]
+    reference_urls = paper["reference_urls"]
 
     concepts = []
     for idea in insights["ideas"]:
@@ -265,10 +457,7 @@ def generate_insights(pdf_url: str) -> PaperInsights:
             # Handle malformed/missing references
             if bibkey in references:
                 reference_text = references[bibkey]
-                # print(bibkey, reference_text)
-                results = arxiv_script.search_arxiv(reference_text)
-                url = results[0]["url"]
-            # print(url)
+                url = reference_urls.get(reference_text) or ""
         else:
             url = pdf_url
         new_uid = str(uuid.uuid4())
@@ -279,12 +468,53 @@ def generate_insights(pdf_url: str) -> PaperInsights:
             description=idea["description"],
             referenceText=reference_text,
         )
-        concept_map[new_uid] = new_concept
         concepts.append(new_concept)
     paper_insights = PaperInsights(url=pdf_url, concepts=concepts)
     return paper_insights
 
 
+def load_paper_insights(pdf_url: str) -> dict:
+    paper_text = pdf_url_to_text(pdf_url)
+    insight_store = get_insight_store()
+    with span("insight_store") as lookup:
+        insights = insight_store.get(paper_text)
+        lookup.set(cache_hit=insights is not None)
+    # Cited references start resolving while Claude is still writing the rest
+    with arxiv_script.ReferenceResolver() as resolver:
+        if insights is None:
+            insights = extract_key_insights_streaming(
+                paper_text, on_citation=resolver.submit
+            )
+            # Served as they are, but only stored when they can be served for
+            # good: a truncated or failed extraction is retried next time
+            if is_complete(insights):
+                insight_store.put(paper_text, insights)
+            else:
+                print(f"Not storing incomplete insights for {pdf_url}")
+
+        try:
+            with open("insight_logs.txt", "a", encoding="utf-8") as f:
+                f.write(json.dumps(insights) + "\n")
+        except:
+            pass
+
+        references = insights["references"]
+        references = {ref["bibkey"]: ref["title"] for ref in references}
+
+        cited_titles = [
+            references[idea["relevant_references"][0]]
+            for idea in insights["ideas"]
+            if idea["relevant_references"]
+            and idea["relevant_references"][0] in references
+        ]
+        reference_urls = resolver.results(cited_titles)
+    return {
+        "insights": insights,
+        "references": references,
+        "reference_urls": reference_urls,
+    }
+
+
 @app.post("/expand-graph-with-new-nodes")
 def expand_graph_with_new_nodes(
     input: ExpandGraphWithNewInsightsSchema,
@@ -292,31 +522,47 @@ def expand_graph_with_new_nodes(
     result = {input.id: {}}
     firestore_client = get_firestore_client()
     insights = generate_insights(pdf_url=input.concept.referenceUrl)
-    for child_concept in insights.concepts:
-        result[input.id][child_concept.id] = {}
-        child_concept.parent = input.concept.id
-        firestore_client.write_data_to_collection(
-            collection_name="graph",
-            document_name=input.query,
-            data={child_concept.id: dict(child_concept)},
-        )
+    with firestore_client.batch() as graph_writes:
+        for child_concept in insights.concepts:
+            result[input.id][child_concept.id] = {}
+            child_concept.parent = input.concept.id
+            concept_store.put(child_concept)
+            graph_writes.write_data_to_collection(
+                collection_name="graph",
+                document_name=input.query,
+                data={child_concept.id: dict(child_concept)},
+            )
     hydrated_graph = hydrate_node(
         input=idGraphSchema(id=input.id, query=input.query, id_map=result)
     )
+    prefetcher.submit_graph(hydrated_graph)
     return hydrated_graph
 
 
+@app.get("/stats")
+def stats():
+    return {
+        "pdfCache": get_pdf_cache().stats(),
+        "generateInsights": insights_single_flight.stats(),
+        "conceptStore": concept_store.stats(),
+        "graphCache": graph_cache.stats(),
+        "prefetch": prefetcher.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/more-info")
-def more_information(concept: ConceptNode) -> str:
+async def more_information(concept: ConceptNode) -> str:
     url = concept.referenceUrl
-    things = time.time()
     if url == "":
-        return expand_without_paper(concept.description)
+        return await expand_without_paper_async(concept.description)
     else:
-        print(time.time() - things)
-        paper_text = pdf_url_to_text(concept.referenceUrl)
-        print(time.time() - things)
-        return expand(concept.description, paper_text)
+        paper_text = await run_in_threadpool(pdf_url_to_text, concept.referenceUrl)
+        return await expand_async(concept.description, paper_text)
 
 
 if __name__ == "__main__":
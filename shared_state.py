@@ -0,0 +1,196 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+from async_cache import async_lru_cache
+
+# State shared by every worker: "sqlite:///state.sqlite3" for workers
+# on one box, "redis://host:6379/0" for several boxes. Unset keeps concepts
+# and memoized results in each process
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "")
+# Seconds memoized results are kept in the shared state
+SHARED_CACHE_TTL = float(os.environ.get("SHARED_CACHE_TTL", 24 * 60 * 60))
+SHARED_STATE_MAX_ENTRIES = int(os.environ.get("SHARED_STATE_MAX_ENTRIES", 100_000))
+
+
+class SqliteStateBackend:
+    # Key-value table in WAL mode, safe to share between processes on one host
+    def __init__(self, path: str, max_entries: int = SHARED_STATE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )"""
+        )
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            self.writes += 1
+            if self.writes % 100 == 0:
+                self._evict()
+            self.db.commit()
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            (value,) = self.db.execute(
+                """INSERT INTO state VALUES (?, '1', NULL)
+                ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+                RETURNING value""",
+                (key,),
+            ).fetchone()
+            self.db.commit()
+        return int(value)
+
+    def clear(self, prefix: str = ""):
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM state WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+            self.db.commit()
+
+    def _evict(self):
+        # Expired rows, then the oldest memoized results beyond max_entries.
+        # Concepts and graph versions are never evicted: hydrating and the
+        # /graph cache rely on them being there
+        self.db.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+        self.db.execute(
+            """DELETE FROM state WHERE rowid IN (
+                SELECT rowid FROM state WHERE substr(key, 1, 5) = 'memo:'
+                ORDER BY rowid DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+
+
+class RedisStateBackend:
+    # Network key-value store shared by workers on any number of hosts;
+    # needs the redis package. Bound memory with Redis' own maxmemory policy
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(key)
+
+    def clear(self, prefix: str = ""):
+        keys = list(self.client.scan_iter(match=prefix + "*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self.client.delete(*keys[start : start + 1000])
+
+
+def make_state_backend(url: str = SHARED_STATE_URL):
+    # sqlite:///relative/path or sqlite:////absolute/path
+    if url.startswith("sqlite:///"):
+        return SqliteStateBackend(url[len("sqlite:///") :])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state():
+    # None when SHARED_STATE_URL is unset
+    global _shared_state
+    if not SHARED_STATE_URL:
+        return None
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = make_state_backend(SHARED_STATE_URL)
+    return _shared_state
+
+
+def _memo_key(namespace: str, args: tuple, kwargs: dict) -> str:
+    arguments = json.dumps([args, kwargs], sort_keys=True, default=str)
+    return f"memo:{namespace}:{hashlib.sha256(arguments.encode('utf-8')).hexdigest()}"
+
+
+def shared_cache(namespace: str, maxsize: int = 1000, version: str = ""):
+    # Drop-in for lru_cache/async_lru_cache (also as traced(..., cache=...)).
+    # Results are memoized as JSON in the shared state when it is configured,
+    # in a per-process LRU otherwise. version goes into the key so results
+    # from an older prompt are not served
+    if version:
+        namespace = f"{namespace}:{version}"
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            local = async_lru_cache(maxsize=maxsize)(fn)
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                state = get_shared_state()
+                if state is None:
+                    return await local(*args, **kwargs)
+                key = _memo_key(namespace, args, kwargs)
+                cached = await asyncio.to_thread(state.get, key)
+                if cached is not None:
+                    return json.loads(cached)
+                result = await fn(*args, **kwargs)
+                await asyncio.to_thread(state.set, key, json.dumps(result), SHARED_CACHE_TTL)
+                return result
+
+        else:
+            local = lru_cache(maxsize=maxsize)(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                state = get_shared_state()
+                if state is None:
+                    return local(*args, **kwargs)
+                key = _memo_key(namespace, args, kwargs)
+                cached = state.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+                result = fn(*args, **kwargs)
+                state.set(key, json.dumps(result), SHARED_CACHE_TTL)
+                return result
+
+            wrapper.cache_info = local.cache_info
+
+        def cache_clear():
+            local.cache_clear()
+            state = get_shared_state()
+            if state is not None:
+                state.clear(f"memo:{namespace}:")
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
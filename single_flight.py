@@ -0,0 +1,54 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight execution; the
+    # key is forgotten once it finishes, so later calls run again
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            in_flight = len(self.calls)
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "inFlight": in_flight,
+        }
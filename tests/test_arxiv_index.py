@@ -0,0 +1,26 @@
+import json
+
+from arxiv_index import ArxivIndex
+
+
+def write_dump(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(record) for record in records))
+
+
+def test_ingest_counts_papers_not_index_rows(tmp_path):
+    records = [
+        {"id": "1706.03762", "title": "Attention Is All You Need", "abstract": "", "update_date": "2017-06-12"},
+        {"id": "1607.06450", "title": "Layer Normalization", "abstract": "", "update_date": "2016-07-21"},
+    ]
+    dump = str(tmp_path / "dump.jsonl")
+    write_dump(dump, records)
+    index = ArxivIndex(str(tmp_path / "index.sqlite3"))
+
+    assert index.ingest(dump) == 2
+    # Unchanged records are skipped, newer ones rewritten
+    assert index.ingest(dump) == 0
+    records[0]["update_date"] = "2023-08-02"
+    write_dump(dump, records)
+    assert index.ingest(dump) == 1
+    assert index.lookup("Attention is all you need")["id"] == "1706.03762"
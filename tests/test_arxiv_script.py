@@ -0,0 +1,21 @@
+import arxiv
+
+import arxiv_script
+from benchmarks.fake_services import FakeServer
+
+
+def test_shared_client_fetches_through_its_session():
+    with FakeServer() as server:
+        client = arxiv_script.SharedArxivClient(api_url=server.url + "/api/query", rate=1000, burst=1000)
+        search = arxiv.Search(query="attention", max_results=5)
+        results = list(client.results(search))
+        connections = server.connections
+
+        assert len(results) == 5
+        assert all(result.pdf_url.startswith(server.url + "/pdf/") for result in results)
+        assert server.requests == 1
+        # Further searches reuse the keep-alive connection
+        list(client.results(arxiv.Search(query="transformers", max_results=5)))
+        assert server.requests == 2
+        assert server.connections == connections
+        assert client.bucket.tokens < 1000
@@ -0,0 +1,47 @@
+from bibliography import entry_bibkey, entry_title, parse_bibliography
+
+REFERENCES = """Body text.
+
+References
+
+[1] Jimmy Lei Ba, Jamie Ryan Kiros, and Geoffrey E. Hinton. Layer normalization. arXiv preprint arXiv:1607.06450, 2016.
+[2] Denny Britz, Anna Goldie, Minh-Thang Luong, and Quoc V. Le. Massive exploration of neural machine translation architectures. CoRR, abs/1703.03906, 2017.
+[3] Quoc V. Le. Building high-level features using large scale unsupervised learning. In ICASSP, 2013.
+[4] H. K. Onnes, Further experiments with liquid helium. Commun. Phys. Lab. Univ. Leiden 12, 120 (1911).
+[5] Ian Goodfellow. Gan. 2014.
+"""
+
+
+def test_given_name_first_authors():
+    entry = "Denny Britz, Anna Goldie, Minh-Thang Luong, and Quoc V. Le. Massive exploration of neural machine translation architectures. CoRR, 2017."
+    assert entry_title(entry) == "Massive exploration of neural machine translation architectures"
+    assert entry_bibkey(entry) == "britz2017"
+
+
+def test_single_author_with_middle_initial():
+    entry = "Quoc V. Le. Building high-level features using large scale unsupervised learning. In ICASSP, 2013."
+    assert entry_title(entry) == "Building high-level features using large scale unsupervised learning"
+    assert entry_bibkey(entry) == "le2013"
+
+
+def test_initials_first_and_surname_first_authors():
+    assert entry_bibkey("H. K. Onnes, Further experiments with liquid helium (1911).") == "onnes1911"
+    assert entry_bibkey("S. Guenon et al., Search for new superconductors (2017).") == "guenon2017"
+    assert entry_bibkey("Vaswani, A., Shazeer, N., & Parmar, N. (2017). Attention is all you need.") == "vaswani2017"
+
+
+def test_unparsed_titles_keep_the_entry():
+    bibliography = parse_bibliography(REFERENCES)
+    assert [ref["bibkey"] for ref in bibliography] == [
+        "ba2016",
+        "britz2017",
+        "le2013",
+        "onnes1911",
+        "goodfellow2014",
+    ]
+    assert bibliography[1]["title"] == "Massive exploration of neural machine translation architectures"
+    assert bibliography[4]["title"] == "Ian Goodfellow. Gan. 2014."
+
+
+def test_too_few_entries_is_no_bibliography():
+    assert parse_bibliography("Text.\n\nReferences\n\n[1] A. Author, A title of a paper (2020).\n") == []
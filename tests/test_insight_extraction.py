@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from benchmarks.fake_services import FakeServer
+
+IDEA = "<novel_idea><idea_name>Idea</idea_name><description>Description</description></novel_idea>"
+
+
+@pytest.fixture
+def claude_server(monkeypatch):
+    with FakeServer(completion=IDEA) as server:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+        monkeypatch.setenv("ANTHROPIC_API_KEY", os.environ.get("ANTHROPIC_API_KEY", "fake"))
+        import claude
+
+        monkeypatch.setattr(claude, "anthropic", claude.Anthropic(base_url=server.url))
+        yield server
+
+
+def test_finished_completion_is_complete(claude_server):
+    from functions.insight_extraction import _stream_insights, is_complete
+
+    insights = _stream_insights("prompt", [], None)
+    assert [idea["idea_name"] for idea in insights["ideas"]] == ["Idea"]
+    assert is_complete(insights)
+
+
+def test_truncated_completion_is_partial(claude_server):
+    from functions.insight_extraction import _stream_insights, is_complete
+
+    claude_server.stop_reason = "max_tokens"
+    insights = _stream_insights("prompt", [], None)
+    assert insights["ideas"] and insights["partial"]
+    assert not is_complete(insights)
+
+
+def test_no_ideas_is_not_complete():
+    from functions.insight_extraction import is_complete, parse_insights
+
+    assert not is_complete(parse_insights("I could not find any ideas.", []))
+
+
+def test_failed_chunk_makes_the_merge_partial():
+    from functions.insight_extraction import is_complete, merge_chunk_insights, parse_insights
+
+    merged = merge_chunk_insights([parse_insights(IDEA, []), RuntimeError("chunk failed")])
+    assert merged["ideas"] and not is_complete(merged)
+    assert is_complete(merge_chunk_insights([parse_insights(IDEA, [])]))
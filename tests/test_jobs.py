@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, InMemoryJobBackend, JobQueue, SqliteJobBackend
+
+
+def pipeline(release: threading.Event):
+    def run(query):
+        yield {"event": "stage", "stage": "search"}
+        release.wait(5)
+        yield {"event": "graph", "graph": {"id": "-1", "children": []}}
+
+    return run
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    if request.param == "memory":
+        backend = InMemoryJobBackend()
+        return lambda: backend
+    return lambda: SqliteJobBackend(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_live_workers_jobs_are_not_resumed(make_backend):
+    release = threading.Event()
+    first = JobQueue(pipeline(release), backend=make_backend(), lease=0.3)
+    job = first.submit("attention")
+    wait_for(lambda: first.get(job["id"])["stage"] == "search")
+
+    # The first worker keeps renewing its lease, so a second one starting up
+    # or polling leaves the job alone
+    second = JobQueue(pipeline(release), backend=make_backend(), lease=0.3)
+    assert second.resume() == 0
+    time.sleep(0.5)
+    assert second._claim() == 0
+    release.set()
+    wait_for(lambda: first.get(job["id"])["status"] == DONE)
+    first.shutdown()
+    second.shutdown()
+
+
+def test_expired_leases_are_taken_over_once(make_backend):
+    never = threading.Event()
+    dead = JobQueue(pipeline(never), backend=make_backend(), lease=0.2)
+    job = dead.submit("attention")
+    wait_for(lambda: dead.get(job["id"])["stage"] == "search")
+    # A worker that stops renewing without shutting down, like a crash
+    dead.stopped.set()
+    time.sleep(0.3)
+
+    release = threading.Event()
+    release.set()
+    workers = [JobQueue(pipeline(release), backend=make_backend(), lease=0.2) for _ in range(3)]
+    assert sum(worker.resume() for worker in workers) == 1
+    wait_for(lambda: workers[0].get(job["id"])["status"] == DONE)
+    never.set()
+    for worker in workers:
+        worker.shutdown()
+
+
+def test_finished_jobs_expire(make_backend):
+    release = threading.Event()
+    release.set()
+    queue = JobQueue(pipeline(release), backend=make_backend(), lease=0.1, retention=0.2)
+    job = queue.submit("attention")
+    wait_for(lambda: queue.get(job["id"])["status"] == DONE)
+    wait_for(lambda: queue.get(job["id"]) is None)
+    queue.shutdown()
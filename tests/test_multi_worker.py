@@ -0,0 +1,206 @@
+"""Several workers sharing one SQLite SHARED_STATE_URL.
+
+Run from the repository root with ``python -m pytest tests``. Claude, arXiv
+and the PDFs are served by benchmarks.fake_services; Firestore is in memory
+per process, so anything a second worker serves has to come from the
+shared state.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from benchmarks.fake_services import FakeServer
+from bibliography import parse_bibliography
+from shared_state import SqliteStateBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY = "superconductors"
+
+
+class AnyPdf(dict):
+    # Every /pdf/<id> is the same paper, whatever id arXiv or Claude made up
+    def __init__(self, pdf: bytes):
+        super().__init__()
+        self.pdf = pdf
+
+    def __contains__(self, path):
+        return path.startswith("/pdf/")
+
+    def __getitem__(self, path):
+        return self.pdf
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def completion(url: str) -> str:
+    # One answer for every prompt: the paper search, expand and insights
+    # parsers each pick out their own tags
+    with open(os.path.join(ROOT, "parsed.txt"), encoding="utf-8") as f:
+        bibliography = parse_bibliography(f.read())
+    ideas = "".join(
+        f"<previous_work_idea><idea_name>Idea {i}</idea_name><description>Idea {i} description"
+        f"</description><relevant_references><bibkey>{reference['bibkey']}</bibkey>"
+        "</relevant_references></previous_work_idea>"
+        for i, reference in enumerate(bibliography[:3])
+    )
+    return (
+        f"<response><title>Superconductor</title><summary>Summary</summary>"
+        f"<url>{url}/pdf/2307.12008v1</url><publishdate>2023</publishdate>"
+        "<description>Expanded description</description><name>Name</name></response>"
+        + ideas
+        + "<novel_idea><idea_name>Novel</idea_name><description>Novel description</description></novel_idea>"
+    )
+
+
+def run(code: str, env: dict) -> str:
+    # code in a fresh interpreter, standing in for another worker
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+@pytest.fixture
+def state_env(tmp_path):
+    return dict(os.environ, SHARED_STATE_URL=f"sqlite:///{tmp_path / 'state.sqlite3'}")
+
+
+def test_incr_is_atomic_across_processes(state_env):
+    code = "from shared_state import get_shared_state\nfor _ in range(200): get_shared_state().incr('counter')"
+    workers = [
+        subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=state_env) for _ in range(4)
+    ]
+    assert [worker.wait() for worker in workers] == [0] * 4
+    assert run("from shared_state import get_shared_state; print(get_shared_state().get('counter'))", state_env) == "800"
+
+
+def test_evict_keeps_concepts_and_graph_versions(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    writer = SqliteStateBackend(path, max_entries=10)
+    writer.set("concept:1", json.dumps({"id": "1"}))
+    writer.incr(f"graph_version:{QUERY}")
+
+    other = SqliteStateBackend(path, max_entries=10)
+    for i in range(300):
+        other.set(f"memo:fn:{i}", str(i))
+    other.set("memo:expired", "", ttl=0.01)
+    time.sleep(0.02)
+    for i in range(300, 399):
+        other.set(f"memo:fn:{i}", str(i))
+
+    assert writer.get("concept:1") == json.dumps({"id": "1"})
+    assert writer.get(f"graph_version:{QUERY}") == "1"
+    # The oldest memoized results are evicted, the newest kept
+    assert writer.get("memo:fn:0") is None
+    assert writer.get("memo:fn:398") == "398"
+    (memos,) = writer.db.execute("SELECT COUNT(*) FROM state WHERE key LIKE 'memo:%'").fetchone()
+    assert memos <= 10
+    (expired,) = writer.db.execute("SELECT COUNT(*) FROM state WHERE key = 'memo:expired'").fetchone()
+    assert expired == 0
+
+
+def test_graph_version_is_shared_across_processes(state_env):
+    version = f"from graph_cache import GraphCache; print(GraphCache().version({QUERY!r}))"
+    bump = f"from graph_cache import GraphCache; GraphCache().bump({QUERY!r})"
+    assert run(version, state_env) == "0"
+    run(bump, state_env)
+    run(bump, state_env)
+    assert run(version, state_env) == "2"
+
+
+@pytest.fixture
+def workers(tmp_path):
+    with open(os.path.join(ROOT, "superconductor.pdf"), "rb") as f:
+        pdf = f.read()
+    with FakeServer() as fake:
+        # Set after construction, FakeServer swaps an empty mapping for {}
+        fake.pdfs = AnyPdf(pdf)
+        fake.completion = completion(fake.url)
+        env = dict(
+            os.environ,
+            ANTHROPIC_API_KEY="fake",
+            ANTHROPIC_BASE_URL=fake.url,
+            ARXIV_API_URL=fake.url + "/api/query",
+            ARXIV_INDEX_PATH=str(tmp_path / "missing.sqlite3"),
+            ARXIV_REQUESTS_PER_SECOND="1000",
+            ARXIV_BURST="1000",
+            FIRESTORE_IN_MEMORY="1",
+            PDF_CACHE_DIR=str(tmp_path / "pdfs"),
+            INSIGHT_STORE_PATH=str(tmp_path / "insights.sqlite3"),
+            SHARED_STATE_URL=f"sqlite:///{tmp_path / 'state.sqlite3'}",
+            PDF_EXTRACT_WORKERS="1",
+            PREFETCH_WORKERS="0",
+        )
+        env.pop("CASSETTE_PATH", None)
+        ports = [free_port(), free_port()]
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+                cwd=ROOT,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for port in ports
+        ]
+        try:
+            urls = [f"http://127.0.0.1:{port}" for port in ports]
+            for url in urls:
+                for _ in range(300):
+                    try:
+                        requests.get(url + "/stats", timeout=1)
+                        break
+                    except requests.ConnectionError:
+                        time.sleep(0.1)
+                else:
+                    pytest.fail(f"{url} did not start")
+            yield fake, urls
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+
+def test_second_worker_serves_the_first_workers_graph(workers):
+    fake, (first, second) = workers
+    response = requests.post(first + "/query", json={"query": QUERY}, timeout=120)
+    assert response.status_code == 200
+    graph = response.json()
+    assert graph["children"]
+
+    # Hydrating on the other worker reads the concepts from the shared state;
+    # its own Firestore is empty
+    id_map = {
+        "-1": {
+            child["id"]: {grandchild["id"]: {} for grandchild in child["children"]}
+            for child in graph["children"]
+        }
+    }
+    response = requests.request(
+        "GET", second + "/hydrate-node", json={"id": "-1", "query": QUERY, "id_map": id_map}, timeout=60
+    )
+    assert response.status_code == 200
+    assert response.json() == graph
+
+    # Expanding on the other worker finds the parent concept and the memoized
+    # paper text and insights, so no new PDF download or insights call
+    child = graph["children"][0]
+    downloads = fake.requests
+    response = requests.post(
+        second + "/expand-graph-with-new-nodes",
+        json={"id": child["id"], "query": QUERY, "concept": {**child, "children": []}},
+        timeout=120,
+    )
+    assert response.status_code == 200
+    assert response.json()["children"]
+    assert fake.requests - downloads <= 2
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import pdf_cache
+from benchmarks.fake_services import FakeServer
+from pdf_cache import PdfCache, PdfTooLarge
+
+PDF = b"%PDF-1.4 first paper"
+OTHER = b"%PDF-1.4 second paper, a bit longer"
+
+
+@pytest.fixture(autouse=True)
+def no_cassette(monkeypatch):
+    monkeypatch.delenv("CASSETTE_PATH", raising=False)
+
+
+@pytest.fixture
+def server():
+    with FakeServer(pdfs={"/pdf/1": PDF, "/pdf/2": OTHER, "/pdf/3": PDF}) as server:
+        yield server
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_fresh_copies_are_served_without_a_request(server, tmp_path):
+    cache = PdfCache(str(tmp_path))
+    path = cache.get(server.url + "/pdf/1")
+    requests = server.requests
+    assert cache.get(server.url + "/pdf/1") == path
+    assert read(path) == PDF
+    assert server.requests == requests
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_stale_copies_are_revalidated_with_the_etag(server, tmp_path):
+    cache = PdfCache(str(tmp_path), revalidate_after=0)
+    path = cache.get(server.url + "/pdf/1")
+    assert cache.get(server.url + "/pdf/1") == path
+    assert cache.revalidations == 1
+
+    # Changed upstream: the 200 replaces the cached copy
+    server.pdfs["/pdf/1"] = OTHER
+    assert read(cache.get(server.url + "/pdf/1")) == OTHER
+
+
+@pytest.mark.parametrize("status", ["404", "connection error"])
+def test_failed_revalidation_serves_the_cached_copy(server, tmp_path, status):
+    cache = PdfCache(str(tmp_path), revalidate_after=0)
+    url = server.url + "/pdf/1"
+    path = cache.get(url)
+    if status == "404":
+        del server.pdfs["/pdf/1"]
+    else:
+        server.__exit__()
+    assert cache.get(url) == path
+    assert read(path) == PDF
+
+
+def test_missing_pdf_is_none(server, tmp_path):
+    assert PdfCache(str(tmp_path)).get(server.url + "/pdf/missing") is None
+
+
+def test_least_recently_used_blobs_are_evicted(server, tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=len(PDF) + len(OTHER))
+    first = cache.get(server.url + "/pdf/1")
+    # Same content under another URL is stored once
+    assert cache.get(server.url + "/pdf/3") == first
+    second = cache.get(server.url + "/pdf/2")
+    assert cache.size_bytes() == len(PDF) + len(OTHER)
+
+    cache.get(server.url + "/pdf/1")
+    cache.put("http://example.org/third.pdf", b"%PDF-1.4 third")
+    # /pdf/2 was used least recently
+    assert not os.path.exists(second) and os.path.exists(first)
+    assert cache.size_bytes() <= cache.max_bytes
+
+
+def test_downloads_over_the_size_cap_are_refused(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_cache, "PDF_DOWNLOAD_MAX_BYTES", len(PDF) - 1)
+    cache = PdfCache(str(tmp_path))
+    with pytest.raises(PdfTooLarge):
+        cache.get(server.url + "/pdf/1")
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".part")] == []
@@ -0,0 +1,22 @@
+import os
+import signal
+
+import pdf_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF = os.path.join(ROOT, "superconductor.pdf")
+
+
+def test_broken_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(pdf_parser, "PDF_PARALLEL_MIN_PAGES", 1)
+    extract = pdf_parser.pdf_to_text.__wrapped__
+    expected = extract(PDF, 2)
+
+    # A worker killed mid-run, like the OOM killer would
+    pool = pdf_parser._extract_pool
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+    assert extract(PDF, 2) == expected
+    assert pdf_parser._extract_pool is not pool
+
+    assert extract(PDF, 2) == expected
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        started.set()
+        release.wait(5)
+        return f"text of {url}"
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        leader = executor.submit(flight.do, "paper", fetch, "paper")
+        started.wait(5)
+        followers = [executor.submit(flight.do, "paper", fetch, "paper") for _ in range(4)]
+        other = executor.submit(flight.do, "other", lambda: "other text")
+        assert other.result(5) == "other text"
+        while flight.stats()["coalesced"] < 4:
+            pass
+        release.set()
+        results = [leader.result(5)] + [future.result(5) for future in followers]
+
+    assert results == ["text of paper"] * 5
+    assert calls == ["paper"]
+    assert flight.stats() == {"executed": 2, "coalesced": 4, "inFlight": 0}
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("download failed")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight.do, "paper", fail)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "paper", fail) for _ in range(2)]
+        while flight.stats()["coalesced"] < 2:
+            pass
+        release.set()
+        for future in [leader] + followers:
+            with pytest.raises(ValueError, match="download failed"):
+                future.result(5)
+
+
+def test_finished_keys_run_again():
+    flight = SingleFlight()
+    assert flight.do("paper", lambda: 1) == 1
+    assert flight.do("paper", lambda: 2) == 2
+    assert flight.stats()["executed"] == 2
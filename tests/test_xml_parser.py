@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from xml_parser import TagParser, parse_tags
+
+COMPLETION = (
+    "Some preamble <with a < b and x > y>\n"
+    "<novel_idea><idea_name>Room temperature</idea_name>"
+    "<description>Works at 300 K</description></novel_idea>\n"
+    "<previous_work_idea><idea_name>Meissner effect</idea_name>"
+    "<description>Levitation</description><relevant_references>"
+    "<bibkey>onnes1911</bibkey><bibkey>guenon2017</bibkey>"
+    "</relevant_references></previous_work_idea>"
+)
+TAGS = ("novel_idea", "previous_work_idea")
+
+
+def summary(elements):
+    return [
+        (element.tag, element.findtext("idea_name"), element.findtext("description"),
+         [bibkey.text for bibkey in element.iter("bibkey")], element.complete)
+        for element in elements
+    ]
+
+
+def parse_in_chunks(text, splits):
+    parser = TagParser(TAGS)
+    elements = []
+    start = 0
+    for end in sorted(splits) + [len(text)]:
+        elements += parser.feed(text[start:end])
+        start = end
+    return elements + parser.close()
+
+
+def test_whole_completion():
+    assert summary(parse_in_chunks(COMPLETION, [])) == [
+        ("novel_idea", "Room temperature", "Works at 300 K", [], True),
+        ("previous_work_idea", "Meissner effect", "Levitation", ["onnes1911", "guenon2017"], True),
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_any_split_points_give_the_same_elements(seed):
+    rng = random.Random(seed)
+    splits = rng.sample(range(1, len(COMPLETION)), rng.randint(1, 40))
+    assert summary(parse_in_chunks(COMPLETION, splits)) == summary(parse_in_chunks(COMPLETION, []))
+
+
+def test_every_single_character_split():
+    assert summary(parse_in_chunks(COMPLETION, list(range(1, len(COMPLETION))))) == summary(
+        parse_in_chunks(COMPLETION, [])
+    )
+
+
+def test_elements_are_returned_as_soon_as_they_close():
+    parser = TagParser(TAGS)
+    end = COMPLETION.index("</novel_idea>")
+    assert parser.feed(COMPLETION[: end + 5]) == []
+    assert [element.tag for element in parser.feed(COMPLETION[end + 5 : end + 20])] == ["novel_idea"]
+
+
+def test_truncated_output_is_closed_incomplete():
+    text = COMPLETION[: COMPLETION.index("Levitation") + 5]
+    elements = parse_in_chunks(text, [])
+    assert summary(elements)[0][-1] is True
+    last = elements[-1]
+    assert last.tag == "previous_work_idea" and not last.complete
+    assert last.findtext("description") == "Levit"
+    assert not last.find("description").complete
+
+
+def test_truncated_inside_a_tag():
+    elements = parse_in_chunks("<novel_idea><idea_name>Name</idea_name><descr", [])
+    assert [(element.tag, element.complete) for element in elements] == [("novel_idea", False)]
+    assert elements[0].find("description") is None
+
+
+def test_unknown_closing_tags_are_text_and_missing_ones_implied():
+    root = parse_tags("<a><b>one</c> two</a>")
+    b = root.find("b")
+    assert b.text == "one</c> two"
+    # </a> closed the unclosed <b> implicitly
+    assert root.find("a").complete and not b.complete
+
+
+def test_malformed_tags_are_text():
+    root = parse_tags("<description>x < y and <3 hearts, < spaced >, <1tag></description>")
+    assert root.findtext("description") == "x < y and <3 hearts, < spaced >, <1tag>"
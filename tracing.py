@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from typing import Optional
+
+# Add a Server-Timing header with the per-stage breakdown to every response
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "0") == "1"
+
+# Seconds; stages range from cache hits to multi-minute Claude completions
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # labels -> [bucket counts..., sum, count]
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(key, le=f'{bound:g}')} {count}")
+                lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{_labels(key)} {value:g}")
+        return lines
+
+
+def _labels(key: tuple, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+stage_duration = Histogram(
+    "pipeline_stage_duration_seconds", "Time spent in each pipeline stage"
+)
+stage_cache = Counter(
+    "pipeline_stage_cache_total", "Cache hits and misses of the cached pipeline stages"
+)
+llm_tokens = Counter(
+    "pipeline_llm_tokens_total", "Claude prompt and completion tokens per stage"
+)
+METRICS = (stage_duration, stage_cache, llm_tokens)
+
+
+class Span:
+    def __init__(self, stage: str, parent: Optional["Span"] = None):
+        self.stage = stage
+        self.parent = parent
+        self.attributes = {}
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        stage_duration.observe(self.duration, stage=self.stage)
+        if "cache_hit" in self.attributes:
+            result = "hit" if self.attributes["cache_hit"] else "miss"
+            stage_cache.inc(stage=self.stage, result=result)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self)
+
+
+class Trace:
+    # Spans finished while handling one request
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        # Summed per stage, nested stages included in their parents' time
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                total = totals.setdefault(span.stage, [0.0, 0])
+                total[0] += span.duration
+                total[1] += 1
+        return ", ".join(
+            f'{stage};dur={duration * 1000:.1f};desc="{count}x"'
+            for stage, (duration, count) in totals.items()
+        )
+
+
+class span:
+    # with span("pdf_to_text") as s: ... s.set(cache_hit=False)
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.stage, _current_span.get())
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.span.set(error=exc_type.__name__)
+        self.span.finish()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    # Attributed to the closest enclosing stage span
+    span = _current_span.get()
+    stage = span.stage if span is not None else "unknown"
+    if span is not None:
+        span.set(
+            prompt_tokens=span.attributes.get("prompt_tokens", 0) + prompt_tokens,
+            completion_tokens=span.attributes.get("completion_tokens", 0)
+            + completion_tokens,
+        )
+    llm_tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+    llm_tokens.inc(completion_tokens, stage=stage, kind="completion")
+
+
+def traced(stage: str, cache=None):
+    # Wraps fn in a span. With cache (lru_cache(...), async_lru_cache(...) or
+    # shared_cache(...))
+    # the function is cached under the span, which gets a cache_hit flag
+    def decorator(fn):
+        is_async = asyncio.iscoroutinefunction(fn)
+        if cache is None:
+            inner = fn
+        elif is_async:
+
+            @functools.wraps(fn)
+            async def compute(*args, **kwargs):
+                annotate(cache_hit=False)
+                return await fn(*args, **kwargs)
+
+            inner = cache(compute)
+        else:
+
+            @functools.wraps(fn)
+            def compute(*args, **kwargs):
+                annotate(cache_hit=False)
+                return fn(*args, **kwargs)
+
+            inner = cache(compute)
+
+        if is_async:
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(stage) as s:
+                    if cache is not None:
+                        s.set(cache_hit=True)
+                    return await inner(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(stage) as s:
+                    if cache is not None:
+                        s.set(cache_hit=True)
+                    return inner(*args, **kwargs)
+
+        if cache is not None:
+            wrapper.cache_clear = inner.cache_clear
+            if hasattr(inner, "cache_info"):
+                wrapper.cache_info = inner.cache_info
+        return wrapper
+
+    return decorator
+
+
+def propagate(fn):
+    # For executor.submit: runs fn in a copy of the caller's context so its
+    # spans land in the caller's request trace
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,10 @@
 import re
+from typing import Iterable, List, Optional
+
+# Only well-formed tag names count as markup; anything else ("a < b") is text
+TAG = re.compile(r"<(/?)([A-Za-z_][\w\-]*)\s*>")
+# A "<" at the end of the input that could still become a tag once more arrives
+PARTIAL_TAG = re.compile(r"</?(?:[A-Za-z_][\w\-]*\s*)?")
 
 
 def extract_tag_content(input_string, tag):
@@ -11,6 +17,110 @@ def extract_tag_content(input_string, tag):
     return elements
 
 
+class Element:
+    __slots__ = ("tag", "text", "children", "complete", "_start")
+
+    def __init__(self, tag: str, start: int = 0):
+        self.tag = tag
+        self.text = ""
+        self.children = []
+        # False when the output was cut off before the closing tag
+        self.complete = False
+        self._start = start
+
+    def iter(self, tag: str):
+        for child in self.children:
+            if child.tag == tag:
+                yield child
+            yield from child.iter(tag)
+
+    def findall(self, tag: str) -> List["Element"]:
+        return list(self.iter(tag))
+
+    def find(self, tag: str) -> Optional["Element"]:
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return next(self.iter(tag), None)
+
+    def findtext(self, tag: str, default=None):
+        element = self.find(tag)
+        return default if element is None else element.text
+
+
+class TagParser:
+    # Single pass over the completion: feed() it chunks as they arrive and it
+    # returns the elements named in `tags` as soon as their closing tag is seen.
+    # Unknown closing tags are kept as text, missing ones are closed implicitly,
+    # and close() finishes whatever was cut off instead of raising.
+    def __init__(self, tags: Iterable[str] = ()):
+        self.tags = set(tags)
+        self.root = Element("document")
+        self.root.complete = True
+        self.stack = []
+        self.buffer = ""
+        self.pos = 0
+
+    def feed(self, chunk: str) -> List[Element]:
+        self.buffer += chunk
+        completed = []
+        stack = self.stack
+        for match in TAG.finditer(self.buffer, self.pos):
+            closing, tag = match.groups()
+            self.pos = match.end()
+            if closing:
+                completed.extend(self._close(tag, match.start()))
+            else:
+                element = Element(tag, self.pos)
+                (stack[-1] if stack else self.root).children.append(element)
+                stack.append(element)
+        # Only the last "<" can be a tag that is still arriving
+        start = self.buffer.rfind("<", self.pos)
+        if start == -1 or not PARTIAL_TAG.fullmatch(self.buffer, start):
+            self.pos = len(self.buffer)
+        else:
+            self.pos = start
+        if not self.stack:
+            # Nothing open refers back into the buffer, so drop what was consumed
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        return completed
+
+    def close(self) -> List[Element]:
+        completed = []
+        while self.stack:
+            element = self.stack.pop()
+            element.text = self.buffer[element._start :].strip()
+            if element.tag in self.tags:
+                completed.append(element)
+        return completed
+
+    def _close(self, tag: str, end: int) -> List[Element]:
+        if self.stack and self.stack[-1].tag == tag:
+            element = self.stack.pop()
+            element.text = self.buffer[element._start : end].strip()
+            element.complete = True
+            return [element] if tag in self.tags else []
+        if not any(element.tag == tag for element in self.stack):
+            return []
+        completed = []
+        while True:
+            element = self.stack.pop()
+            element.text = self.buffer[element._start : end].strip()
+            element.complete = element.tag == tag
+            if element.tag in self.tags:
+                completed.append(element)
+            if element.tag == tag:
+                return completed
+
+
+def parse_tags(input_string: str) -> Element:
+    parser = TagParser()
+    parser.feed(input_string)
+    parser.close()
+    return parser.root
+
+
 # from lxml import etree
 
 